@@ -3,21 +3,26 @@
 
 功能概述：
 - 筛选成立时间超过3年的债券型公募基金
-- 从全市场基金中筛选名称包含"债"字的基金
+- 按基金类型和名称关键字对全市场基金分类（bond_classifier.py），选出债券基金，排除可转债、债券ETF和联接基金
 - 验证每只基金的成立时间是否满足3年以上条件
-- 使用多线程并发处理提高数据获取效率
-- 输出符合条件的基金代码列表到Excel文件
+- 使用异步引擎在一个事件循环内并发请求，提高数据获取效率
+- 输出符合条件的基金代码列表到列式中间文件
 
 处理流程：
-1. 获取全市场公募基金列表（使用fund_name_em接口）
-2. 筛选基金名称中包含"债"字的债券型基金
+1. 获取全市场公募基金列表（使用fund_name_em接口），保存当天快照并与之前的快照比较新增、删除、更名的基金
+2. 对整张基金表分类，保留债券基金并排除可转债、债券ETF、联接基金（不请求任何单只基金的接口）
 3. 计算3年前的日期作为筛选阈值
-4. 并发验证每只基金的成立时间（使用fund_individual_basic_info_xq接口）
-5. 保存符合条件的基金代码到Excel文件
-6. 记录处理失败的基金信息用于后续排查
+4. 把A/C/E等份额归并为家族（share_class.py），只为每个家族的代表份额并发获取本地索引中缺少的成立时间
+   （使用fund_individual_basic_info_xq接口）；
+   日常运行时缺少的只有新增基金；索引只追加不删除，基金列表某次返回不全时也不会重新请求
+5. 对成立日期索引做向量化比较，筛选成立满3年的基金（可选只保留每个家族的代表份额）
+6. 保存符合条件的基金代码到列式中间文件
+7. 记录处理失败的基金信息用于后续排查
 
 输出文件：
-- 大于三年的债券基金代码.xlsx：包含所有符合条件的基金代码
+- stage_data/stage1.arrow：包含所有符合条件的基金代码（可用 stage_io.py 导出为Excel）
+- establish_index.parquet：基金成立日期索引，成立时间不会变化，获取一次后长期复用
+- universe_snapshots/<日期>.parquet：全市场基金列表的每日快照（universe_snapshot.py）
 - 基金处理错误记录.xlsx：记录处理过程中出现错误的基金信息
 """
 
@@ -26,129 +31,166 @@ import pandas as pd
 from datetime import datetime, timedelta
 import time
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
+import argparse
 
+import async_fetch
+import bond_classifier
+import checkpoint
+import establish_index
+import share_class
+import stage_io
+import universe_snapshot
+from fund_cache import cached_call
 
-# 定义一个辅助函数，用于处理单个基金的成立时间验证
-def check_fund_establishment(fund_code, fund_name, three_years_ago):
+
+# 定义一个辅助函数，用于解析单个基金的成立日期（fund_info 为接口返回的DataFrame或请求异常）
+def check_fund_establishment(fund_code, fund_name, fund_info):
     try:
-        # 官网指定接口：获取基金基本信息（含成立时间）
-        # 文档地址：https://akshare.akfamily.xyz/data/fund/fund_public.html#fund-individual-basic-info-xq
-        fund_info = ak.fund_individual_basic_info_xq(symbol=fund_code)
-
-        # 提取成立时间（官网返回格式为DataFrame，项目列含"成立时间"）
-        establish_row = fund_info[fund_info['item'] == '成立时间']
-        if establish_row.empty:
-            raise ValueError("未找到'成立时间'字段")
-
-        establish_date_str = establish_row['value'].values[0]
-        # 解析日期（官网示例格式：2015-01-01）
-        establish_date = datetime.strptime(establish_date_str, '%Y-%m-%d')
-
-        # 判断是否符合条件
-        if establish_date <= three_years_ago:
-            print(f"✅ 符合条件（成立日期：{establish_date_str}）")
-            return fund_code, None
-        else:
-            print(f"❌ 成立时间不足3年（成立日期：{establish_date_str}）")
-            return None, None
+        if isinstance(fund_info, Exception):
+            raise fund_info
+        establish_date = establish_index.parse_establish_date(fund_info)
+        print(f"✅ 获取成立日期：{fund_code} {establish_date.strftime('%Y-%m-%d')}")
+        return fund_code, establish_date, None
 
     except Exception as e:
         error_msg = f"❌ 处理失败：{str(e)}"
         print(error_msg)
-        return None, {
+        return fund_code, None, {
             '基金代码': fund_code,
             '基金名称': fund_name,
             '错误信息': str(e)
         }
 
 
-def get_valid_bond_funds():
+def load_bond_universe():
+    """
+    获取全市场基金列表并保存快照，选出债券基金，把A/C/E等份额归并为家族（不请求单只基金的接口）
+    :return: (债券基金DataFrame, 份额家族DataFrame（见 share_class.resolve_families）, 基金列表差异DataFrame)；
+             获取基金列表失败时返回 None
+    """
     # 1. 获取公募基金列表（官网推荐：fund_name_em）
     print("===== 步骤1：获取基金列表（fund_name_em） =====")
     try:
         # 官网接口：获取全市场公募基金代码和名称
-        all_funds = ak.fund_name_em()
+        all_funds = cached_call(ak.fund_name_em)
         all_funds['基金代码'] = all_funds['基金代码'].astype(str).str.zfill(6)  # 6位代码格式化
         print(f"成功获取 {len(all_funds)} 只基金")
     except Exception as e:
         print(f"获取基金列表失败：{e}")
         return None
 
-    # 2. 筛选名称含"债"的基金
+    # 保存当天的基金列表快照，与之前最近一天比较新增、删除、更名的基金
+    _, universe_diff = universe_snapshot.record_universe(all_funds)
+
+    # 2. 按基金类型和名称关键字对整张表分类，排除可转债、债券ETF、联接基金（在请求成立时间之前）
     print("\n===== 步骤2：筛选债券类基金 =====")
-    bond_funds = all_funds[all_funds['基金简称'].str.contains('债', na=False)]
+    bond_funds, category_counts = bond_classifier.select_bond_funds(all_funds)
     total_bond = len(bond_funds)
-    print(f"名称含'债'的基金共 {total_bond} 只")
+    print("债券基金分类：" + "，".join(f"{category} {count} 只" for category, count in category_counts.items()))
+    print(f"排除{'、'.join(bond_classifier.EXCLUDED_CATEGORIES)}后共 {total_bond} 只")
+
+    # 同一只基金的A/C/E等份额归并为一个家族，成立日期只按代表份额获取一次
+    families = share_class.resolve_families(bond_funds)
+    print(f"按份额类别归并为 {families['代表代码'].nunique()} 只基金（家族）")
+    return bond_funds, families, universe_diff
+
+
+def select_valid_bond_funds(resume=False, share_classes="all"):
+    """
+    筛选成立满3年的债券基金（不读写文件）
+    :param resume: 是否从上次中断的断点续跑
+    :param share_classes: "all" 保留全部份额，"representative" 每只基金的A/C/E等份额只保留一个代表份额
+    :return: (符合条件的基金代码DataFrame, 错误记录列表)；获取基金列表失败时返回 None
+    """
+    universe = load_bond_universe()
+    if universe is None:
+        return None
+    bond_funds, families, universe_diff = universe
+    representative_codes = families['代表代码'].unique().tolist()
+    total_family = len(representative_codes)
 
     # 3. 计算3年前日期阈值
     three_years_ago = datetime.now() - timedelta(days=3 * 365)
-    valid_codes = []
     error_records = []
 
-    # 4. 验证成立时间（官网接口：fund_individual_basic_info_xq）
+    # 4. 补全成立日期索引（官网接口：fund_individual_basic_info_xq，只请求索引中没有的基金）
     print(f"\n===== 步骤3：验证成立时间（fund_individual_basic_info_xq） =====")
     print(f"成立时间阈值：{three_years_ago.strftime('%Y-%m-%d')}")
 
-    # 使用线程池并发处理基金验证
-    # 限制并发数以避免高频访问问题
-    max_workers = 15
-    print(f"使用线程池并发处理，最大并发数：{max_workers}")
+    index = establish_index.load_index()
+    journal = checkpoint.StageJournal("stage1", resume=resume)
+    # 续跑时先把断点日志中已获取的成立日期并入索引（程序被强制结束时索引可能没来得及保存）
+    journal_dates = {code: datetime.strptime(record['成立时间'], '%Y-%m-%d')
+                     for code, record in journal.records().items()}
+    index = establish_index.add_dates(index, journal_dates)
+    missing = establish_index.missing_codes(index, representative_codes)
+    fund_names = dict(zip(bond_funds['基金代码'], bond_funds['基金简称']))
+    total_missing = len(missing)
+    print(f"本地索引已有 {total_family - total_missing} 只，需要获取成立日期 {total_missing} 只")
+    if missing:
+        added = set(universe_snapshot.codes_with_change(universe_diff, "新增"))
+        print(f"其中新增基金 {len(added.intersection(missing))} 只，其余为之前获取失败的基金")
+
+    # 使用异步引擎在一个事件循环内并发请求，按主机限制并发数以避免高频访问问题
+    new_dates = {}
 
     # 记录处理进度
-    processed_count = 0
     start_time = time.time()
-    # 用于控制请求频率的队列
-    request_queue = Queue()
-
-    def controlled_submit(executor, func, *args):
-        # 如果队列中有10个请求，等待0.2秒
-        if request_queue.qsize() >= 15:
-            print("--- 暂停0.15秒，降低请求频率 ---")
-            time.sleep(0.15)
-            # 清空队列
-            while not request_queue.empty():
-                request_queue.get()
-        request_queue.put(1)
-        return executor.submit(func, *args)
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        # 使用 enumerate 替代 iterrows 的索引，确保进度计数连续
-        for current_progress, row in enumerate(bond_funds.iterrows(), start=1):
-            _, row_data = row
-            fund_code = row_data['基金代码']
-            fund_name = row_data['基金简称']
-
-            print(f"\n[{current_progress}/{total_bond}] 提交处理：{fund_code} {fund_name}")
-
-            future = controlled_submit(executor, check_fund_establishment, fund_code, fund_name, three_years_ago)
-            futures.append(future)
-
-        for future in as_completed(futures):
-            valid_code, error_record = future.result()
-            if valid_code:
-                valid_codes.append(valid_code)
-            if error_record:
-                error_records.append(error_record)
-            processed_count += 1
-            elapsed_time = time.time() - start_time
-            if processed_count % 10 == 0:
-                print(f"已处理 {processed_count}/{total_bond} 只基金，耗时 {elapsed_time:.2f} 秒")
-
-    # 5. 保存结果
+
+    def on_result(fund_code, fund_info):
+        _, establish_date, error_record = check_fund_establishment(fund_code, fund_names[fund_code], fund_info)
+        if establish_date is not None:
+            new_dates[fund_code] = establish_date
+            journal.append(fund_code, {'成立时间': establish_date.strftime('%Y-%m-%d')})
+        if error_record:
+            error_records.append(error_record)
+            journal.append(fund_code, error_record, ok=False)
+
+    try:
+        if missing:
+            async_fetch.run_fetch_many("fund_individual_basic_info_xq", missing, on_result=on_result, keep=False)
+            print(f"已处理 {total_missing} 只基金，耗时 {time.time() - start_time:.2f} 秒")
+    finally:
+        # 中途中断时也保存已获取的成立日期，下次运行不再重复请求
+        index = establish_index.add_dates(index, new_dates)
+        establish_index.save_index(index)
+        journal.close()
+    journal.finish()
+
+    # 对整个索引做向量化比较，各份额沿用代表份额的成立日期
+    is_valid = establish_index.established_before(index, families['代表代码'], three_years_ago)
+    if share_classes == "representative":
+        is_valid = is_valid & (families['基金代码'] == families['代表代码']).to_numpy()
+    valid_df = bond_funds.loc[is_valid, ['基金代码']].reset_index(drop=True)
+
     print("\n===== 处理完成 =====")
-    print(f"符合条件的基金：{len(valid_codes)} 只 | 处理失败：{len(error_records)} 只")
+    print(f"符合条件的基金：{len(valid_df)} 只 | 处理失败：{len(error_records)} 只")
+    return valid_df, error_records
+
 
-    pd.DataFrame(valid_codes, columns=['基金代码']).to_excel(
-        '大于三年的债券基金代码.xlsx', index=False
-    )
+def save_error_records(error_records):
+    """保存处理失败的基金信息"""
     if error_records:
         pd.DataFrame(error_records).to_excel('基金处理错误记录.xlsx', index=False)
         print("错误记录已保存，可用于排查个别基金问题")
-    print("结果文件：大于三年的债券基金代码.xlsx")
+
+
+def get_valid_bond_funds(resume=False, share_classes="all"):
+    selected = select_valid_bond_funds(resume=resume, share_classes=share_classes)
+    if selected is None:
+        return None
+    valid_df, error_records = selected
+
+    # 5. 保存结果（列式中间文件，Excel由 stage_io.py 单独导出）
+    stage_io.write_stage(valid_df, "stage1")
+    save_error_records(error_records)
+    print(f"结果文件：{stage_io.stage_path('stage1')}")
 
 
 if __name__ == "__main__":
-    get_valid_bond_funds()
+    parser = argparse.ArgumentParser(description="筛选成立满3年的债券基金")
+    parser.add_argument("--resume", action="store_true", help="从上次中断的断点续跑")
+    parser.add_argument("--share-classes", choices=share_class.SHARE_CLASS_MODES, default="all",
+                        help="all 保留全部份额（默认），representative 每只基金只保留一个代表份额（优先A类）")
+    args = parser.parse_args()
+    get_valid_bond_funds(resume=args.resume, share_classes=args.share_classes)
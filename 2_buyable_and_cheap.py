@@ -12,130 +12,113 @@
 3. 数据来源：使用AKShare的fund_purchase_em接口获取实时申购信息
 
 处理流程：
-1. 读取前期筛选出的债券基金代码文件
+1. 读取第1步输出的债券基金代码（列式中间文件）
 2. 获取全市场基金申购状态数据
-3. 并发查询每只基金的具体信息
-4. 应用筛选条件过滤基金
-5. 将筛选结果保存回原文件
+3. 按基金代码一次性关联申购状态数据（哈希连接），未查询到的基金标记为"未查询到"
+4. 对整列应用筛选条件过滤基金
+5. 将筛选结果保存为本步骤的列式中间文件
 
 技术特点：
-- 使用多线程并发查询提高效率
-- 每15次查询间隔0.15秒避免请求过频
+- 申购状态数据一次性获取，请求经过全局限速器
+- 以基金代码为键一次关联全部基金，耗时随基金数线性增长，不再逐只基金扫描整张申购状态表
 - 自动处理数据类型转换和异常情况
 """
 
 import akshare as ak
 import pandas as pd
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import stage_io
+from fund_cache import cached_call
 
-def query_fund_info(code, all_fund_data):
+# 购买起点上限（元）
+MAX_PURCHASE_START = 1000
+
+# 需要排除的申购状态
+EXCLUDED_STATUSES = ["封闭期", "暂停申购"]
+
+# 从申购状态数据中取出的列
+INFO_COLUMNS = ["基金简称", "申购状态", "购买起点"]
+
+
+def join_fund_info(fund_codes, all_fund_data):
     """
-    查询单只基金的信息
-    :param code: 基金代码
+    按基金代码关联申购信息
+    :param fund_codes: 6位字符串基金代码列表
     :param all_fund_data: 所有基金的申购状态数据
-    :return: 单只基金的信息字典
+    :return: 与 fund_codes 顺序相同的DataFrame：基金代码、基金简称、申购状态、购买起点；
+             未查询到的基金这三列为"未查询到"
     """
-    # 确保基金代码为 6 位字符串
-    code = str(code).zfill(6)
-    # 查找对应基金的数据
-    fund_info = all_fund_data[all_fund_data["基金代码"] == code]
-
-    if not fund_info.empty:
-        # 提取需要的信息
-        purchase_status = fund_info.iloc[0]["申购状态"]
-        purchase_start = fund_info.iloc[0]["购买起点"]
-        fund_name = fund_info.iloc[0]["基金简称"]
-
-        return {
-            "基金代码": code,
-            "基金简称": fund_name,
-            "申购状态": purchase_status,
-            "购买起点": purchase_start
-        }
-    else:
+    # 以基金代码为键建立索引（同一代码有多行时取第一行），一次关联全部基金
+    fund_info = all_fund_data.drop_duplicates(subset="基金代码").set_index("基金代码")
+    result_df = fund_info.reindex(pd.Index(fund_codes, name="基金代码"))[INFO_COLUMNS]
+
+    missing = ~result_df.index.isin(fund_info.index)
+    for code in result_df.index[missing]:
         print(f"基金代码 {code} 未查询到相关数据")
-        return {
-            "基金代码": code,
-            "基金简称": "未查询到",
-            "申购状态": "未查询到",
-            "购买起点": "未查询到"
-        }
+    result_df = result_df.astype(object)
+    result_df.loc[missing] = "未查询到"
+    return result_df.reset_index()
 
 
-def query_fund_purchase_status():
-    # 读取包含基金代码的Excel文件
-    input_file = r"C:\Users\wawon\PycharmProjects\PythonProject1\.venv\Bond All in One\大于三年的债券基金代码.xlsx"
-    try:
-        # 读取原文件数据
-        df = pd.read_excel(input_file)
-        # 确保基金代码列转换为 6 位字符串类型
-        df["基金代码"] = df.iloc[:, 0].astype(str).str.zfill(6)
-        # 读取第一列基金代码
-        fund_codes = df["基金代码"].tolist()
-        print(f"成功读取基金代码，共{len(fund_codes)}只基金")
-    except Exception as e:
-        print(f"读取基金代码失败：{e}")
-        return
+def filter_buyable_funds(df):
+    """
+    查询申购信息并筛选可申购、购买起点不超过1000元的基金（不读写文件）
+    :param df: 含6位字符串"基金代码"列的DataFrame
+    :return: 合并申购信息并筛选后的DataFrame；获取申购状态数据失败时返回 None
+    """
+    fund_codes = df["基金代码"].tolist()
 
     # 获取所有基金的申购状态数据
     try:
         print("正在获取所有基金的申购状态数据...")
-        all_fund_data = ak.fund_purchase_em()
+        all_fund_data = cached_call(ak.fund_purchase_em)
         # 将基金代码转换为字符串类型，确保匹配
         all_fund_data["基金代码"] = all_fund_data["基金代码"].astype(str)
         print("所有基金申购状态数据获取完成")
     except Exception as e:
         print(f"获取申购状态数据失败：{e}")
-        return
+        return None
 
-    # 准备存储结果的列表
-    result_list = []
-    total = len(fund_codes)
+    # 按基金代码一次性关联申购信息
     start_time = time.time()
-    request_count = 0
-
-    # 使用线程池并发处理基金信息查询
-    with ThreadPoolExecutor() as executor:
-        # 提交所有任务
-        future_to_code = {executor.submit(query_fund_info, code, all_fund_data): code for code in fund_codes}
-
-        for i, future in enumerate(as_completed(future_to_code), 1):
-            # 打印进度
-            print(f"查询进度：{i}/{total}")
-            try:
-                result = future.result()
-                result_list.append(result)
-                request_count += 1
-                # 每查询15只基金休息0.15秒，避免请求过于频繁
-                if request_count % 15 == 0:
-                    time.sleep(0.15)
-            except Exception as e:
-                print(f"查询基金代码 {future_to_code[future]} 时出错: {e}")
-
-    # 将结果转换为DataFrame
-    result_df = pd.DataFrame(result_list)
-    # 确保结果中的基金代码也是字符串类型
-    result_df["基金代码"] = result_df["基金代码"].astype(str)
+    result_df = join_fund_info(fund_codes, all_fund_data)
+    print(f"已关联 {len(fund_codes)} 只基金的申购信息，耗时 {time.time() - start_time:.2f} 秒")
+
     # 合并原数据和查询结果
     merged_df = pd.merge(df, result_df, on="基金代码", how="left")
 
     # 删除购买起点大于1000元的基金，同时转换非数字值为NaN后处理
     try:
         merged_df["购买起点"] = pd.to_numeric(merged_df["购买起点"], errors="coerce")
-        merged_df = merged_df[merged_df["购买起点"] <= 1000]
+        merged_df = merged_df[merged_df["购买起点"] <= MAX_PURCHASE_START]
     except Exception as e:
         print(f"处理购买起点数据时出错：{e}")
 
     # 删除申购状态为“封闭期”“暂停申购”的基金
     if "申购状态" in merged_df.columns:
-        merged_df = merged_df[~merged_df["申购状态"].isin(["封闭期", "暂停申购"])]
+        merged_df = merged_df[~merged_df["申购状态"].isin(EXCLUDED_STATUSES)]
+
+    return merged_df
+
+
+def query_fund_purchase_status():
+    # 读取第1步输出的基金代码（只读取基金代码列）
+    try:
+        df = stage_io.read_stage("stage1", columns=["基金代码"])
+        print(f"成功读取基金代码，共{len(df)}只基金")
+    except Exception as e:
+        print(f"读取基金代码失败：{e}")
+        return
+
+    merged_df = filter_buyable_funds(df)
+    if merged_df is None:
+        return
 
-    # 将结果保存回原文件
+    # 保存本步骤结果
     try:
-        merged_df.to_excel(input_file, index=False)
-        print(f"查询完成，结果已保存至：{input_file}")
+        stage_io.write_stage(merged_df, "stage2")
+        print(f"查询完成，结果已保存至：{stage_io.stage_path('stage2')}")
     except Exception as e:
         print(f"保存结果失败：{e}")
 
@@ -10,46 +10,48 @@
 1. Ulcer指数：衡量基金回撤风险的指标，数值越小风险越低
 2. 年化收益率：基金在指定期间的复合年化收益
 3. Martin比率：(年化收益率-无风险利率)/Ulcer指数，衡量风险调整后收益
+4. 最大回撤：区间内从峰值到谷底的最大跌幅
 
 处理流程：
-1. 读取筛选后的债券基金代码列表
-2. 获取每只基金在指定时间区间的累计净值数据
-3. 并发计算各基金的Ulcer指数和Martin比率
+1. 读取第2步输出的债券基金数据（列式中间文件）
+2. 批量更新每只基金的本地累计净值数据（只下载新交易日），取指定时间区间
+3. 净值每到一批就对齐为矩阵，由计算进程批量计算各基金的Ulcer指数、Martin比率和最大回撤
 4. 应用筛选条件：年化收益率3.5%-10% 且 Martin比率≥3.5
-5. 将计算结果与原数据合并后保存
+5. 将计算结果与原数据合并后保存为本步骤的列式中间文件
 
 技术特点：
-- 使用多线程并发处理提高计算效率
+- 使用异步引擎在一个事件循环内并发获取净值，按主机限制并发数
 - 实现重试机制应对网络不稳定情况
-- 添加随机延迟避免请求过于频繁
-- 自动适配CPU核心数优化线程池大小
+- 所有请求经过按主机设置的全局令牌桶限速器，不再随机休眠
+- 净值数据保存在本地，每次运行只下载新交易日的净值
+- 指标按列向量化批量计算（batch_metrics.py），不再逐只基金调用pandas
+- 网络请求与指标计算分离（compute_pool.py）：计算在进程池中进行，净值矩阵通过共享内存传递
+- 每批计算结果取回后立即写入断点日志，中断后加上 --resume 只重新处理还没有完成的基金
+- 起止日期落在周末、节假日时对齐到之前最近的交易日（trading_calendar.py），不会因此丢弃基金
 """
 
-import akshare as ak
 import pandas as pd
 import numpy as np
 from datetime import datetime
-import time
-import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-
-def get_fund_data(fund_code, max_retries=3, retry_delay=5):
-    """获取基金数据，包含重试机制"""
-    for attempt in range(max_retries):
-        try:
-            # 添加随机延迟，降低请求频率
-            time.sleep(random.uniform(0.5, 2))
-            fund_data = ak.fund_open_fund_info_em(
-                symbol=str(fund_code).zfill(6),  # 确保基金代码为 6 位字符串
-                indicator="累计净值走势"  # 修改指标为累计净值走势
-            )
-            return fund_data
-        except Exception as e:
-            print(f"获取基金 {fund_code} 数据时出错（尝试 {attempt + 1}/{max_retries}）: {str(e)}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-    return None
+import argparse
+
+import checkpoint
+import compute_pool
+import nav_store
+import stage_io
+import trading_calendar
+
+# 设置默认无风险利率为 1.5%
+RISK_FREE_RATE = 1.5
+
+# 定义目标日期
+START_DATE_STR = "2023-02-24"
+END_DATE_STR = "2026-02-24"
+
+# 筛选条件：年化收益率区间（%）和Martin比率下限
+MIN_ANNUALIZED_RETURN = 3.5
+MAX_ANNUALIZED_RETURN = 10
+MIN_MARTIN_RATIO = 3.5
 
 
 def calculate_ulcer_index(net_values):
@@ -90,9 +92,11 @@ def calculate_martin_ratio(annualized_return, risk_free_rate, ulcer_index):
     return (annualized_return - risk_free_rate) / ulcer_index
 
 
-def process_fund(fund_code, start_date_str, end_date_str, risk_free_rate):
-    """处理单个基金的计算逻辑"""
-    fund_data = get_fund_data(fund_code)
+def evaluate_fund(fund_code, fund_data, start_date_str, end_date_str, risk_free_rate):
+    """
+    逐只基金计算指标的参考实现（fund_data 为已获取的净值数据，可以为 None），用于核对批量计算结果和基准测试；
+    screen_funds 使用 compute_pool 批量计算，不调用本函数
+    """
     result = None
 
     if fund_data is not None and not fund_data.empty:
@@ -101,16 +105,16 @@ def process_fund(fund_code, start_date_str, end_date_str, risk_free_rate):
         fund_data.set_index('净值日期', inplace=True)
         fund_data.sort_index(inplace=True)
 
-        try:
-            # 获取指定日期的净值数据，修改为获取累计净值
-            start_value = fund_data.loc[start_date_str]['累计净值']
-            end_value = fund_data.loc[end_date_str]['累计净值']
-        except KeyError:
-            print(f"未找到基金 {fund_code} 指定日期的净值数据，请检查数据是否包含对应日期。")
+        # 起止日期对齐到当天或之前最近的交易日（落在周末、节假日时不再丢弃基金）
+        start_pos, end_pos = trading_calendar.prior_positions(fund_data.index, [start_date_str, end_date_str])
+        max_gap = pd.Timedelta(days=trading_calendar.MAX_GAP_DAYS)
+        if (start_pos < 0 or fund_data.index[start_pos] < pd.to_datetime(start_date_str) - max_gap
+                or fund_data.index[end_pos] < pd.to_datetime(end_date_str) - max_gap):
+            print(f"未找到基金 {fund_code} 指定日期当天或之前的净值数据，请检查数据是否包含对应日期。")
             return result
         else:
-            # 提取指定日期范围内的累计净值列（复权净值）
-            net_values = fund_data.loc[start_date_str:end_date_str]['累计净值']
+            # 提取指定日期范围内的累计净值列（复权净值），期初为起始日期当天或之前最近的净值
+            net_values = fund_data['累计净值'].iloc[start_pos:end_pos + 1]
             if net_values.empty:
                 print(f"基金 {fund_code} 指定日期范围内未获取到有效的累计净值数据。")
                 return result
@@ -143,64 +147,103 @@ def process_fund(fund_code, start_date_str, end_date_str, risk_free_rate):
     return result
 
 
-if __name__ == "__main__":
-    # 设置默认无风险利率为 1.5%
-    risk_free_rate = 1.5
-
-    # 定义目标日期
-    start_date_str = "2023-02-24"
-    end_date_str = "2026-02-24"
+def filter_metrics(results_df):
+    """
+    按阈值筛选计算结果：只保留年化收益率在3.5%到10%之间且Martin比率≥3.5的基金
+    :param results_df: 含年化收益率(%)、Martin Ratio两列的DataFrame
+    :return: 筛选后的DataFrame
+    """
+    if results_df.empty:
+        return results_df
+    return results_df[
+        (results_df['年化收益率(%)'] >= MIN_ANNUALIZED_RETURN) & 
+        (results_df['年化收益率(%)'] <= MAX_ANNUALIZED_RETURN) & 
+        (results_df['Martin Ratio'] >= MIN_MARTIN_RATIO)
+    ]
+
+
+def screen_funds(fund_codes_df, start_date_str=START_DATE_STR, end_date_str=END_DATE_STR,
+                 risk_free_rate=RISK_FREE_RATE, resume=False, workers=None):
+    """
+    计算Ulcer指数和Martin比率并筛选基金（不读写文件）
+    :param fund_codes_df: 第一列为6位字符串基金代码的DataFrame
+    :param resume: 是否从上次中断的断点续跑（计算区间和无风险利率须与上次一致）
+    :param workers: 计算进程数，默认为物理核心数；为0时在当前进程内计算
+    :return: 合并计算结果并筛选后的DataFrame
+    """
+    fund_codes = fund_codes_df.iloc[:, 0].tolist()
+
+    params = {'start': start_date_str, 'end': end_date_str, 'risk_free_rate': risk_free_rate}
+    journal = checkpoint.StageJournal("stage3", params=params, resume=resume)
+
+    # 初始化结果列表，续跑时先取回断点日志中已完成的结果
+    results = list(journal.records().values())
+    done_codes = journal.done_codes()
+    pending_codes = [code for code in fund_codes if code not in done_codes]
+
+    def on_result(fund_code, fund_data):
+        # 没有净值的基金不进入计算层，直接记入断点日志
+        if fund_data is None or fund_data.empty:
+            print(f"未获取到基金 {fund_code} 有效的净值数据，请检查基金代码或网络连接。")
+            journal.append(fund_code, None, ok=False)
+            return
+        pool.add(fund_code, fund_data)
+
+    def on_chunk(codes, metrics_df):
+        # 每批计算完成后立即记入断点日志，中断后续跑只重新计算还没有完成的批次
+        metrics_by_code = {record['基金代码']: record for record in metrics_df.to_dict('records')}
+        for fund_code in codes:
+            result = metrics_by_code.get(str(fund_code).zfill(6))
+            if result:
+                results.append(result)
+                print(
+                    f"债券基金 {fund_code} 在 {start_date_str} 至 {end_date_str} 的年化收益率为: {result['年化收益率(%)']:.4f}%，"
+                    f"Ulcer 指数为: {result['Ulcer指数(%)']:.4f}%，Martin Ratio 为: {result['Martin Ratio']:.4f}")
+            else:
+                print(f"未找到基金 {fund_code} 指定日期当天或之前的净值数据，请检查数据是否包含对应日期。")
+            journal.append(fund_code, result, ok=result is not None)
 
-    # 读取基金代码文件
-    input_path = r"C:\Users\wawon\PycharmProjects\PythonProject1\.venv\Bond All in One\大于三年的债券基金代码.xlsx"
     try:
-        # 先读取文件获取列名
-        temp_df = pd.read_excel(input_path, nrows=0)
-        first_column = temp_df.columns[0]
-        # 重新读取文件并指定第一列的数据类型为字符串
-        fund_codes_df = pd.read_excel(input_path, dtype={first_column: str})
-        fund_codes = fund_codes_df.iloc[:, 0].tolist()
-    except Exception as e:
-        print(f"读取文件 {input_path} 出错: {str(e)}")
-        exit(1)
-
-    # 初始化结果列表
-    results = []
+        # I/O层：通过异步引擎批量更新本地净值（只有需要更新的基金访问网络）；
+        # 计算层：每到一批基金就转为紧凑容器写入共享内存，由进程池计算（净值不在本进程中整体保留），
+        # 每批结果取回后立即写入断点日志
+        with compute_pool.ComputePool(start_date_str, end_date_str, risk_free_rate, workers=workers,
+                                      on_chunk=on_chunk) as pool:
+            nav_store.refresh_many(pending_codes, on_result=on_result, keep=False)
+            pool.results()
+    finally:
+        journal.close()
+    journal.finish()
 
-    # 计算最佳线程数，通常设置为 CPU 核心数的 2 - 4 倍
-    import multiprocessing
+    # 将结果转换为 DataFrame
+    results_df = pd.DataFrame(results, columns=['基金代码', '年化收益率(%)', 'Ulcer指数(%)', 'Martin Ratio', '最大回撤(%)'])
 
-    max_workers = multiprocessing.cpu_count() * 4
+    results_df = filter_metrics(results_df)
 
-    # 使用线程池并发处理基金数据，指定最大线程数
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for fund_code in fund_codes:
-            future = executor.submit(process_fund, fund_code, start_date_str, end_date_str, risk_free_rate)
-            futures.append(future)
+    # 将结果合并到原数据中，使用内连接只保留匹配的行
+    return pd.merge(fund_codes_df, results_df, left_on=fund_codes_df.columns[0], right_on='基金代码', how='inner')
 
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                results.append(result)
 
-    # 将结果转换为 DataFrame
-    results_df = pd.DataFrame(results)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="计算Ulcer指数和Martin比率并筛选基金")
+    parser.add_argument("--resume", action="store_true", help="从上次中断的断点续跑")
+    parser.add_argument("--workers", type=int, help="计算进程数，默认为物理核心数，0 表示在当前进程内计算")
+    args = parser.parse_args()
 
-    # 添加筛选逻辑，只保留年化收益率在3.5%到10%之间且Martin比率≥3.5的基金
-    if not results_df.empty:
-        results_df = results_df[
-            (results_df['年化收益率(%)'] >= 3.5) & 
-            (results_df['年化收益率(%)'] <= 10) & 
-            (results_df['Martin Ratio'] >= 3.5)
-        ]
+    # 读取第2步输出的基金数据
+    try:
+        fund_codes_df = stage_io.read_stage("stage2")
+    except Exception as e:
+        print(f"读取第2步结果出错: {str(e)}")
+        exit(1)
 
-    # 将结果合并到原数据中，使用内连接只保留匹配的行
-    merged_df = pd.merge(fund_codes_df, results_df, left_on=fund_codes_df.columns[0], right_on='基金代码', how='inner')
+    merged_df = screen_funds(fund_codes_df, START_DATE_STR, END_DATE_STR, RISK_FREE_RATE, resume=args.resume,
+                             workers=args.workers)
 
-    # 将结果保存回原文件
+    # 保存本步骤结果
+    output_path = stage_io.stage_path("stage3")
     try:
-        merged_df.to_excel(input_path, index=False)
-        print(f"结果已成功保存到 {input_path}")
+        stage_io.write_stage(merged_df, "stage3")
+        print(f"结果已成功保存到 {output_path}")
     except Exception as e:
-        print(f"保存文件 {input_path} 出错: {str(e)}")
+        print(f"保存文件 {output_path} 出错: {str(e)}")
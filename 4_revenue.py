@@ -2,147 +2,87 @@
 债券基金收益率查询程序
 
 功能概述：
-- 查询筛选后债券基金的近期收益率表现
+- 计算筛选后债券基金的近期收益率表现
 - 获取每只基金近1年和近3月的收益率数据
 - 将收益率信息整合到基金基础数据中
 
 数据来源：
-- 使用AKShare的fund_individual_achievement_xq接口
-- 获取基金的阶段业绩数据
+- 第3步已更新的本地累计净值（nav_store），不再逐只基金请求阶段业绩接口
+- 本步骤只读取本地文件，不访问网络
 
 处理流程：
-1. 读取经过前期筛选的债券基金代码列表
-2. 遍历每只基金代码查询收益率数据
-3. 提取近1年收益率和近3月收益率指标
-4. 处理查询异常和数据缺失情况
+1. 读取第3步输出的债券基金数据（列式中间文件）
+2. 读取所有基金的本地累计净值，对齐为一个矩阵
+3. 一次计算所有基金近1年、近3月的区间收益率（可通过 --horizons、--metrics 增加近3年、近5年区间，
+   以及年化收益率、Ulcer指数、Martin比率、最大回撤、Calmar比率等指标）
+4. 净值历史不足的区间记为空值
 5. 将收益率数据添加到原数据框中
-6. 保存更新后的完整数据到Excel文件
+6. 保存更新后的完整数据为本步骤的列式中间文件（Excel由 stage_io.py 单独导出）
+
+说明：
+- 收益率按累计净值计算，截止到各基金最新的净值日期，与阶段业绩接口的口径可能略有差异
 
 异常处理机制：
-- 网络请求异常的重试机制
-- 数据结构变化的兼容性处理
-- 查询频率控制避免接口限制
 - 备用文件保存机制确保数据不丢失
 """
 
-import akshare as ak
-import pandas as pd
-import time
-import json
-from requests.exceptions import RequestException
+import argparse
+
+import batch_metrics
+import nav_store
+import stage_io
+
+# 添加到结果中的区间和指标（可选项见 batch_metrics.HORIZONS、batch_metrics.METRIC_COLUMNS）
+RETURN_HORIZONS = ["近1年", "近3月"]
+RETURN_METRICS = ["收益率"]
+
+
+def add_fund_returns(df, horizons=RETURN_HORIZONS, metrics=RETURN_METRICS):
+    """
+    计算近1年、近3月等区间的收益率并添加到DataFrame右侧（不读写文件）
+    :param df: 第一列为6位字符串基金代码的DataFrame
+    :param horizons: 区间名称列表
+    :param metrics: 指标名称列表
+    :return: 添加指标列后的DataFrame，列名如 近1年收益率(%)
+    """
+    fund_codes = df.iloc[:, 0].astype(str).str.zfill(6).tolist()
+    print(f"共{len(fund_codes)}只基金需要计算收益率")
 
+    # 第3步已更新本地净值，这里只读取本地文件，不再访问网络
+    navs = {fund_code: nav_store.read_nav(fund_code) for fund_code in fund_codes}
 
-def query_fund_returns():
-    # 输入文件路径
-    input_file = r"C:\Users\wawon\PycharmProjects\PythonProject1\.venv\Bond All in One\大于三年的债券基金代码.xlsx"
+    # 所有区间、所有指标在一次载入的净值矩阵上计算
+    metrics_df = batch_metrics.multi_horizon_metrics(navs, horizons, metrics)
+    metrics_df = metrics_df.set_index("基金代码").reindex(fund_codes)
 
+    # 将指标添加到原DataFrame的右侧
+    for column in metrics_df.columns:
+        df[column] = metrics_df[column].to_numpy()
+        missing = metrics_df.index[metrics_df[column].isna()]
+        if len(missing):
+            print(f"{column}：{len(missing)} 只基金净值历史不足，记为空值")
+    return df
+
+
+def query_fund_returns(horizons=RETURN_HORIZONS, metrics=RETURN_METRICS):
     try:
-        # 读取Excel文件
-        df = pd.read_excel(input_file)
-        # 获取第一列的基金代码并转换为字符串
-        fund_codes = df.iloc[:, 0].astype(str).tolist()
-        total = len(fund_codes)
-        print(f"成功读取Excel文件，共{total}只基金需要查询")
+        # 读取第3步输出的基金数据
+        df = stage_io.read_stage("stage3")
+        print(f"成功读取第3步结果，共{len(df)}只基金需要查询")
     except Exception as e:
-        print(f"读取Excel文件失败：{e}")
+        print(f"读取第3步结果失败：{e}")
         return
 
-    # 准备存储收益率的列表
-    returns_1y = []
-    returns_3m = []
+    df = add_fund_returns(df, horizons, metrics)
 
-    # 遍历每个基金代码查询数据
-    for i, code in enumerate(fund_codes, 1):
-        # 确保基金代码是6位格式（补全前导零）
-        code = code.zfill(6)
-        # 打印进度信息
-        print(f"查询进度：{i}/{total}，当前基金代码：{code}")
-
-        try:
-            # 调用接口获取基金业绩数据，增加超时设置
-            fund_data = ak.fund_individual_achievement_xq(symbol=code, timeout=10)
-
-            # 提取近1年收益率（阶段业绩中的近1年）
-            cond_1y = (fund_data["业绩类型"] == "阶段业绩") & (fund_data["周期"] == "近1年")
-            ret_1y = fund_data.loc[cond_1y, "本产品区间收益"].values[0] if not fund_data[cond_1y].empty else None
-
-            # 提取近3月收益率（阶段业绩中的近3月）
-            cond_3m = (fund_data["业绩类型"] == "阶段业绩") & (fund_data["周期"] == "近3月")
-            ret_3m = fund_data.loc[cond_3m, "本产品区间收益"].values[0] if not fund_data[cond_3m].empty else None
-
-            returns_1y.append(ret_1y)
-            returns_3m.append(ret_3m)
-            print(f"基金{code}查询成功：近1年收益率={ret_1y}%，近3月收益率={ret_3m}%")
-
-        except KeyError as e:
-            # 处理数据结构变化导致的KeyError
-            print(f"基金{code}数据结构异常：{e}，尝试兼容处理")
-            try:
-                # 尝试直接获取接口原始数据进行解析
-                fund_data = ak.fund_individual_achievement_xq(symbol=code, timeout=10)
-                # 转换为字典查看结构
-                data_dict = fund_data.to_dict('records')
-
-                # 重新尝试查找近1年和近3月数据
-                ret_1y = None
-                ret_3m = None
-                for item in data_dict:
-                    if item.get('业绩类型') == '阶段业绩':
-                        if item.get('周期') == '近1年':
-                            ret_1y = item.get('本产品区间收益')
-                        if item.get('周期') == '近3月':
-                            ret_3m = item.get('本产品区间收益')
-
-                returns_1y.append(ret_1y if ret_1y is not None else "未找到数据")
-                returns_3m.append(ret_3m if ret_3m is not None else "未找到数据")
-            except Exception as e2:
-                print(f"兼容处理失败：{e2}")
-                returns_1y.append("查询失败")
-                returns_3m.append("查询失败")
-
-        except RequestException as e:
-            print(f"基金{code}网络请求失败：{e}，将重试一次")
-            # 重试一次
-            try:
-                time.sleep(2)  # 等待2秒后重试
-                fund_data = ak.fund_individual_achievement_xq(symbol=code, timeout=15)
-
-                cond_1y = (fund_data["业绩类型"] == "阶段业绩") & (fund_data["周期"] == "近1年")
-                ret_1y = fund_data.loc[cond_1y, "本产品区间收益"].values[0] if not fund_data[cond_1y].empty else None
-
-                cond_3m = (fund_data["业绩类型"] == "阶段业绩") & (fund_data["周期"] == "近3月")
-                ret_3m = fund_data.loc[cond_3m, "本产品区间收益"].values[0] if not fund_data[cond_3m].empty else None
-
-                returns_1y.append(ret_1y)
-                returns_3m.append(ret_3m)
-                print(f"基金{code}重试成功")
-            except Exception as e2:
-                print(f"基金{code}重试也失败：{e2}")
-                returns_1y.append("查询失败")
-                returns_3m.append("查询失败")
-
-        except Exception as e:
-            print(f"基金{code}查询失败：{e}")
-            returns_1y.append("查询失败")
-            returns_3m.append("查询失败")
-
-        # 调整查询频率，避免请求过于频繁
-        if i % 15 == 0:
-            print("稍作休息，避免请求过于频繁...")
-            time.sleep(0.75)  # 延长休息时间
-
-    # 将收益率数据添加到原DataFrame的右侧
-    df["近1年收益率(%)"] = returns_1y
-    df["近3月收益率(%)"] = returns_3m
-
-    # 保存回原Excel文件
+    # 保存本步骤结果
     try:
-        df.to_excel(input_file, index=False)
-        print(f"所有查询完成，结果已添加到原文件：{input_file}")
+        stage_io.write_stage(df, "stage4")
+        print(f"所有查询完成，结果已保存到：{stage_io.stage_path('stage4')}")
     except Exception as e:
         print(f"保存文件失败：{e}")
         # 保存到备用文件
-        backup_file = input_file.replace(".xlsx", "_backup.xlsx")
+        backup_file = "大于三年的债券基金代码_backup.xlsx"
         try:
             df.to_excel(backup_file, index=False)
             print(f"已将结果保存到备用文件：{backup_file}")
@@ -151,4 +91,10 @@ def query_fund_returns():
 
 
 if __name__ == "__main__":
-    query_fund_returns()
+    parser = argparse.ArgumentParser(description="计算债券基金近1年、近3月收益率")
+    parser.add_argument("--horizons", default=",".join(RETURN_HORIZONS),
+                        help=f"区间，逗号分隔，可选 {','.join(batch_metrics.HORIZONS)}")
+    parser.add_argument("--metrics", default=",".join(RETURN_METRICS),
+                        help=f"指标，逗号分隔，可选 {','.join(batch_metrics.METRIC_COLUMNS)}")
+    args = parser.parse_args()
+    query_fund_returns(args.horizons.split(","), args.metrics.split(","))
@@ -0,0 +1,371 @@
+"""
+异步批量数据获取引擎
+
+功能概述：
+- 基于asyncio和aiohttp，在一个事件循环内完成成千上万次小请求，不再为每个请求占用一个线程
+- 所有请求共用一个连接池（keep-alive），复用TLS连接
+- 每个接口的并发数由AIMD控制器根据延迟和错误率自动调整，按主机设置硬上限
+- 通过全局令牌桶限速器控制每秒请求数
+- 直接请求akshare背后的数据接口，解析为与akshare相同格式的DataFrame
+- 相同接口、相同参数的请求同时进行时只发出一次，等待者共用解析后的结果（single_flight.py）
+- 批量请求时最多同时存在 MAX_IN_FLIGHT 个任务，基金代码按需从可迭代对象（可以是生成器）中取出，
+  结果按完成顺序逐个交出，不为整个基金池预先创建任务，也不必保留全部结果
+
+支持的接口（方法名与akshare函数名一致）：
+1. fund_name_em：全市场基金列表
+2. fund_purchase_em：基金申购状态
+3. fund_open_fund_info_em：累计净值走势
+4. fund_individual_achievement_xq：基金阶段业绩
+5. fund_individual_basic_info_xq：基金基本信息（含成立时间）
+另有 fund_nav_since：指定日期之后的累计净值（天天基金历史净值接口，用于增量更新）
+
+用法：
+results = run_fetch_many("fund_individual_achievement_xq", ["000001", "000003"])
+
+async with AsyncFetcher() as fetcher:
+    async for symbol, data in fetcher.iter_fetch("fund_individual_basic_info_xq", codes):
+        ...
+"""
+
+import asyncio
+import functools
+import json
+import re
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+import pandas as pd
+from akshare.utils import demjson
+
+import concurrency
+import fund_cache
+import rate_limit
+import single_flight
+
+# 每个主机允许的最大并发请求数（硬上限，实际并发数由各接口的AIMD控制器在此范围内自动调整）
+HOST_CONCURRENCY = {
+    "fund.eastmoney.com": 32,
+    "api.fund.eastmoney.com": 32,
+    "danjuanfunds.com": 16,
+}
+DEFAULT_HOST_CONCURRENCY = 4
+
+EASTMONEY_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/114.0.0.0 Safari/537.36"
+}
+LSJZ_HEADERS = dict(EASTMONEY_HEADERS, Referer="https://fundf10.eastmoney.com/")
+XQ_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/80.0.3987.149 Safari/537.36"
+}
+
+LSJZ_PAGE_SIZE = 20
+
+# 批量请求时同时存在的任务数上限（实际并发请求数仍由主机上限和AIMD控制器决定，这里只限制排队中的任务）
+MAX_IN_FLIGHT = 256
+
+# 网络类错误才重试，解析错误直接抛出
+RETRY_EXCEPTIONS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# 同一事件循环内相同接口、相同参数的请求只发出一次（跨 AsyncFetcher 实例）
+_flight = single_flight.AsyncSingleFlight()
+
+
+async def bounded_map(worker, items, limit=MAX_IN_FLIGHT):
+    """
+    在有界窗口内并发执行 worker，按完成顺序逐个交出结果
+    :param worker: 协程函数 worker(item)
+    :param items: 可迭代对象（可以是生成器），只在窗口有空位时才取下一个
+    :param limit: 同时存在的任务数上限
+    :return: 异步生成器，依次产生 (item, worker(item) 的返回值)；worker 抛出异常时取消其余任务并抛出该异常
+    """
+    items = iter(items)
+    pending = {}
+
+    def submit():
+        for item in items:
+            pending[asyncio.ensure_future(worker(item))] = item
+            return True
+        return False
+
+    try:
+        while len(pending) < limit and submit():
+            pass
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                # 先补充新任务再交出结果，调用方处理结果时请求不会中断
+                submit()
+                yield item, task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def coalesced(method):
+    """接口方法的装饰器：相同参数的请求正在进行时，等待并共用其解析后的DataFrame"""
+    @functools.wraps(method)
+    async def wrapper(self, *args):
+        return await _flight.do((method.__name__,) + args, lambda: method(self, *args))
+    return wrapper
+
+
+class AsyncFetcher:
+    """
+    异步数据获取器，需要在 async with 中使用：
+
+    async with AsyncFetcher() as fetcher:
+        nav_df = await fetcher.fund_open_fund_info_em("000001")
+    """
+
+    def __init__(self, timeout=10, max_retries=3, retry_delay=1):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._session = None
+        self._host_semaphores = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=sum(HOST_CONCURRENCY.values()) + DEFAULT_HOST_CONCURRENCY,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+
+    def _semaphore(self, host):
+        if host not in self._host_semaphores:
+            limit = HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY)
+            self._host_semaphores[host] = asyncio.Semaphore(limit)
+        return self._host_semaphores[host]
+
+    async def _get_text(self, endpoint, url, params=None, headers=None):
+        """带并发控制、限速和重试的GET请求，返回响应文本"""
+        host = urlparse(url).hostname
+        limiter = rate_limit.limiter_for(host)
+        controller = concurrency.controller_for(endpoint, max_limit=HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+        for attempt in range(self.max_retries):
+            try:
+                async with self._semaphore(host):
+                    await controller.acquire()
+                    ok = False
+                    started = None
+                    try:
+                        await limiter.acquire_async()
+                        started = time.monotonic()
+                        async with self._session.get(url, params=params, headers=headers) as response:
+                            response.raise_for_status()
+                            text = await response.text()
+                        ok = True
+                        return text
+                    finally:
+                        latency = time.monotonic() - started if started is not None else 0.0
+                        controller.release(latency, ok)
+            except RETRY_EXCEPTIONS:
+                if attempt == self.max_retries - 1:
+                    raise
+                await asyncio.sleep(self.retry_delay * (attempt + 1))
+
+    async def _get_json(self, endpoint, url, params=None, headers=None):
+        return json.loads(await self._get_text(endpoint, url, params=params, headers=headers))
+
+    @coalesced
+    async def fund_name_em(self):
+        """全市场基金列表，与 ak.fund_name_em() 格式相同"""
+        text = await self._get_text(
+            "fund_name_em", "https://fund.eastmoney.com/js/fundcode_search.js", headers=EASTMONEY_HEADERS
+        )
+        data_json = json.loads(text[text.index("["):text.rindex("]") + 1])
+        temp_df = pd.DataFrame(data_json)
+        temp_df.columns = ["基金代码", "拼音缩写", "基金简称", "基金类型", "拼音全称"]
+        return temp_df
+
+    @coalesced
+    async def fund_purchase_em(self):
+        """基金申购状态，与 ak.fund_purchase_em() 格式相同"""
+        params = {"t": "8", "page": "1,50000", "js": "reData", "sort": "fcode,asc"}
+        text = await self._get_text(
+            "fund_purchase_em", "https://fund.eastmoney.com/Data/Fund_JJJZ_Data.aspx", params=params, headers=EASTMONEY_HEADERS
+        )
+        data_json = demjson.decode(text[text.index("{"):text.rindex("}") + 1])
+        temp_df = pd.DataFrame(data_json["datas"])
+        temp_df.insert(0, "序号", range(1, len(temp_df) + 1))
+        temp_df.columns = [
+            "序号", "基金代码", "基金简称", "基金类型", "最新净值/万份收益", "最新净值/万份收益-报告时间",
+            "申购状态", "赎回状态", "下一开放日", "购买起点", "日累计限定金额", "-", "-", "手续费",
+        ]
+        temp_df = temp_df.drop(columns="-")
+        temp_df["下一开放日"] = pd.to_datetime(temp_df["下一开放日"], errors="coerce").dt.date
+        temp_df["最新净值/万份收益"] = pd.to_numeric(temp_df["最新净值/万份收益"], errors="coerce")
+        temp_df["购买起点"] = pd.to_numeric(temp_df["购买起点"], errors="coerce")
+        temp_df["日累计限定金额"] = pd.to_numeric(temp_df["日累计限定金额"], errors="coerce")
+        temp_df["手续费"] = pd.to_numeric(temp_df["手续费"].str.strip("%"), errors="coerce")
+        return temp_df
+
+    @coalesced
+    async def fund_open_fund_info_em(self, symbol):
+        """累计净值走势，与 ak.fund_open_fund_info_em(symbol, indicator="累计净值走势") 格式相同"""
+        text = await self._get_text(
+            "fund_open_fund_info_em", f"https://fund.eastmoney.com/pingzhongdata/{symbol}.js", headers=EASTMONEY_HEADERS
+        )
+        match = re.search(r"Data_ACWorthTrend\s*=\s*(\[.*?\])\s*;", text, re.S)
+        if match is None:
+            return pd.DataFrame(columns=["净值日期", "累计净值"])
+        temp_df = pd.DataFrame(json.loads(match.group(1)), columns=["x", "y"])
+        temp_df["x"] = pd.to_datetime(temp_df["x"], unit="ms", utc=True).dt.tz_convert("Asia/Shanghai").dt.date
+        temp_df.columns = ["净值日期", "累计净值"]
+        temp_df["累计净值"] = pd.to_numeric(temp_df["累计净值"], errors="coerce")
+        return temp_df
+
+    @coalesced
+    async def fund_nav_since(self, symbol, start_date):
+        """start_date（含）之后的累计净值，按页读取直到取完，列名与 fund_open_fund_info_em 相同"""
+        rows = []
+        page = 1
+        while True:
+            params = {
+                "fundCode": symbol,
+                "pageIndex": page,
+                "pageSize": LSJZ_PAGE_SIZE,
+                "startDate": start_date.strftime("%Y-%m-%d"),
+                "endDate": "",
+            }
+            data_json = await self._get_json(
+                "fund_nav_since", "https://api.fund.eastmoney.com/f10/lsjz", params=params, headers=LSJZ_HEADERS
+            )
+            page_rows = data_json["Data"]["LSJZList"] or []
+            rows.extend(page_rows)
+            if len(rows) >= data_json["TotalCount"] or not page_rows:
+                break
+            page += 1
+        temp_df = pd.DataFrame(rows, columns=["FSRQ", "LJJZ"])
+        temp_df.columns = ["净值日期", "累计净值"]
+        temp_df["累计净值"] = pd.to_numeric(temp_df["累计净值"], errors="coerce")
+        return temp_df
+
+    @coalesced
+    async def fund_individual_achievement_xq(self, symbol):
+        """基金业绩，与 ak.fund_individual_achievement_xq(symbol) 格式相同"""
+        data_json = await self._get_json(
+            "fund_individual_achievement_xq", f"https://danjuanfunds.com/djapi/fundx/base/fund/achievement/{symbol}", headers=XQ_HEADERS
+        )
+        json_data = data_json["data"]
+        frames = []
+        for key, name in {"annual_performance_list": "年度业绩", "stage_performance_list": "阶段业绩"}.items():
+            temp_df = pd.DataFrame.from_dict(json_data[key], orient="columns")
+            temp_df["type"] = name
+            temp_df = temp_df[["type", "period_time", "self_nav", "self_max_draw_down", "self_nav_rank"]]
+            temp_df.columns = ["业绩类型", "周期", "本产品区间收益", "本产品最大回撒", "周期收益同类排名"]
+            frames.append(temp_df)
+        combined_df = pd.concat(frames, ignore_index=True)
+        combined_df = combined_df.map(lambda x: x if "%" not in str(x) else x.replace("%", ""))
+        combined_df[["本产品区间收益", "本产品最大回撒"]] = combined_df[["本产品区间收益", "本产品最大回撒"]].astype(float)
+        return combined_df
+
+    @coalesced
+    async def fund_individual_basic_info_xq(self, symbol):
+        """基金基本信息，与 ak.fund_individual_basic_info_xq(symbol) 格式相同（item、value两列）"""
+        data_json = await self._get_json(
+            "fund_individual_basic_info_xq", f"https://danjuanfunds.com/djapi/fund/{symbol}", headers=XQ_HEADERS
+        )
+        temp_df = pd.json_normalize(data_json["data"])
+        temp_df = temp_df.rename(columns={
+            "fd_code": "基金代码",
+            "fd_name": "基金名称",
+            "fd_full_name": "基金全称",
+            "found_date": "成立时间",
+            "totshare": "最新规模",
+            "keeper_name": "基金公司",
+            "manager_name": "基金经理",
+            "trup_name": "托管银行",
+            "type_desc": "基金类型",
+            "rating_source": "评级机构",
+            "rating_desc": "基金评级",
+            "invest_orientation": "投资策略",
+            "invest_target": "投资目标",
+            "performance_bench_mark": "业绩比较基准",
+        })
+        columns = [
+            "基金代码", "基金名称", "基金全称", "成立时间", "最新规模", "基金公司", "基金经理",
+            "托管银行", "基金类型", "评级机构", "基金评级", "投资策略", "投资目标", "业绩比较基准",
+        ]
+        temp_df = temp_df.reindex(columns=columns)
+        temp_df = temp_df.T.reset_index()
+        temp_df.columns = ["item", "value"]
+        return temp_df
+
+    async def iter_fetch(self, endpoint, symbols, use_cache=True, limit=MAX_IN_FLIGHT):
+        """
+        并发请求同一接口的多只基金，按完成顺序逐个交出结果
+        :param endpoint: 接口方法名，例如 "fund_individual_achievement_xq"
+        :param symbols: 基金代码的可迭代对象（可以是生成器）
+        :param use_cache: 是否读写 fund_cache 磁盘缓存
+        :param limit: 同时存在的任务数上限
+        :return: 异步生成器，依次产生 (基金代码, DataFrame或异常)
+        """
+        method = getattr(self, endpoint)
+        cacheable = use_cache and endpoint in fund_cache.ENDPOINT_TTL
+
+        async def fetch_one(symbol):
+            kwargs = {"symbol": symbol}
+            data = fund_cache.load(endpoint, kwargs) if cacheable else None
+            if data is None:
+                try:
+                    data = await method(symbol)
+                except Exception as e:
+                    data = e
+                else:
+                    if cacheable:
+                        fund_cache.store(endpoint, kwargs, data)
+            return data
+
+        async for symbol, data in bounded_map(fetch_one, symbols, limit):
+            yield symbol, data
+
+    async def fetch_many(self, endpoint, symbols, on_result=None, use_cache=True, keep=True):
+        """
+        并发请求同一接口的多只基金
+        :param endpoint: 接口方法名，例如 "fund_individual_achievement_xq"
+        :param symbols: 基金代码的可迭代对象（可以是生成器）
+        :param on_result: 每只基金完成时的回调 on_result(symbol, result)，result 为DataFrame或异常
+        :param use_cache: 是否读写 fund_cache 磁盘缓存
+        :param keep: 为 False 时结果只交给 on_result 处理，不在返回的字典中保留，节省内存
+        :return: {基金代码: DataFrame或异常}
+        """
+        total = len(symbols) if hasattr(symbols, "__len__") else None
+        results = {}
+        completed = 0
+        async for symbol, data in self.iter_fetch(endpoint, symbols, use_cache=use_cache):
+            completed += 1
+            if keep:
+                results[symbol] = data
+            if on_result is not None:
+                on_result(symbol, data)
+            if completed % 50 == 0 or completed == total:
+                print(f"{endpoint}：已完成 {completed}/{total if total is not None else '?'}")
+        return results
+
+
+def run_fetch_many(endpoint, symbols, on_result=None, use_cache=True, keep=True):
+    """同步调用入口：在新的事件循环中运行 AsyncFetcher.fetch_many"""
+    async def main():
+        async with AsyncFetcher() as fetcher:
+            return await fetcher.fetch_many(endpoint, symbols, on_result=on_result, use_cache=use_cache, keep=keep)
+
+    if hasattr(symbols, "__len__") and not symbols:
+        return {}
+    results = asyncio.run(main())
+    concurrency.log_states()
+    return results
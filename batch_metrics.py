@@ -0,0 +1,312 @@
+"""
+批量计算风险收益指标（向量化）
+
+功能概述：
+- 把多只基金的累计净值对齐为一个二维矩阵（行为交易日、列为基金），缺失的日期为 NaN
+- 按列一次性计算所有基金的年化收益率、Ulcer指数、Martin比率和最大回撤
+- 使用按列累计最大值和带掩码的求和，不再逐只基金调用pandas
+- 计算口径与 3_Ulcer_and_Martin.py 中的逐只基金函数一致（结果在浮点误差范围内相同）
+
+处理流程：
+1. build_panel：合并所有基金的净值日期，按日期位置把每只基金的累计净值填入矩阵
+   （也可直接传入 compact_nav.CompactNav，所有净值点一次性填入）
+2. panel_metrics：对矩阵按列计算各项指标
+3. evaluate_panel：以上两步的组合，返回每只基金一行的结果表
+4. multi_horizon_metrics：一次载入净值矩阵，计算截止日期前近3月、近1年、近3年、近5年等多个区间的
+   收益率、年化收益率、Ulcer指数、Martin比率、最大回撤和Calmar比率（区间和指标均可选择）
+
+日期对齐（trading_calendar.py）：
+- 区间起止日期对齐到共用交易日历中当天或之前最近的交易日，各基金取对齐日期当天或之前最近的净值
+- 起止日期落在周末、节假日时不再丢弃基金；之前30天内都没有净值的基金视为无效
+"""
+
+import numpy as np
+import pandas as pd
+
+import compact_nav
+import trading_calendar
+
+# 多区间指标的回看区间：名称 -> 月数
+HORIZONS = {"近3月": 3, "近1年": 12, "近3年": 36, "近5年": 60}
+
+# 可输出的指标：名称 -> 列名后缀
+METRIC_COLUMNS = {
+    "收益率": "收益率(%)",
+    "年化收益率": "年化收益率(%)",
+    "Ulcer指数": "Ulcer指数(%)",
+    "Martin Ratio": "Martin Ratio",
+    "最大回撤": "最大回撤(%)",
+    "Calmar比率": "Calmar比率",
+}
+METRIC_KEYS = {
+    "收益率": "total_return",
+    "年化收益率": "annualized_return",
+    "Ulcer指数": "ulcer_index",
+    "Martin Ratio": "martin_ratio",
+    "最大回撤": "max_drawdown",
+    "Calmar比率": "calmar_ratio",
+}
+
+
+def build_panel(navs, start_date_str, end_date_str):
+    """
+    把多只基金的累计净值对齐为二维矩阵
+    :param navs: {基金代码: 含净值日期、累计净值两列的DataFrame}（净值日期升序且不重复，与 nav_store 一致），
+                 或 compact_nav.CompactNav
+    :param start_date_str: 矩阵第一行不早于该日期
+    :param end_date_str: 矩阵最后一行不晚于该日期
+    :return: (交易日DatetimeIndex, 基金代码列表, 形状为 [交易日数, 基金数] 的float64矩阵)
+    """
+    if isinstance(navs, compact_nav.CompactNav):
+        return _build_compact_panel(navs, start_date_str, end_date_str)
+
+    start_date = pd.to_datetime(start_date_str)
+    end_date = pd.to_datetime(end_date_str)
+
+    codes = []
+    columns = []
+    for fund_code, fund_data in navs.items():
+        if fund_data is None or fund_data.empty:
+            continue
+        dates = fund_data['净值日期'].to_numpy(dtype='datetime64[ns]')
+        values = fund_data['累计净值'].to_numpy(dtype=np.float64)
+        in_range = (dates >= start_date.to_datetime64()) & (dates <= end_date.to_datetime64())
+        codes.append(fund_code)
+        columns.append((dates[in_range], values[in_range]))
+
+    if not columns:
+        return pd.DatetimeIndex([]), codes, np.empty((0, 0))
+
+    # 所有基金净值日期的并集（共用交易日历）作为矩阵的行
+    calendar = trading_calendar.build_calendar([dates for dates, _ in columns])
+    panel = np.full((len(calendar), len(codes)), np.nan)
+    for j, (dates, values) in enumerate(columns):
+        panel[calendar.searchsorted(dates), j] = values
+    return calendar, codes, panel
+
+
+def _build_compact_panel(navs, start_date_str, end_date_str):
+    """由紧凑容器构建矩阵：所有基金的净值点一次性定位到矩阵中，不逐只基金处理"""
+    first_day = (np.datetime64(pd.to_datetime(start_date_str).date()) - compact_nav.EPOCH).astype(np.int64)
+    last_day = (np.datetime64(pd.to_datetime(end_date_str).date()) - compact_nav.EPOCH).astype(np.int64)
+
+    # 每个净值点所属的基金（列号）
+    columns = np.repeat(np.arange(len(navs)), np.diff(navs.offsets))
+    in_range = (navs.days >= first_day) & (navs.days <= last_day)
+    days = navs.days[in_range]
+
+    # 所有基金净值日期的并集（共用交易日历）作为矩阵的行
+    calendar_days = np.unique(days)
+    panel = np.full((len(calendar_days), len(navs)), np.nan)
+    panel[np.searchsorted(calendar_days, days), columns[in_range]] = navs.values[in_range] / compact_nav.VALUE_SCALE
+    calendar = pd.DatetimeIndex((compact_nav.EPOCH + calendar_days.astype('timedelta64[D]')).astype('datetime64[ns]'))
+    return calendar, list(navs.codes), panel
+
+
+def panel_metrics(dates, panel, start_date_str, end_date_str, risk_free_rate):
+    """
+    按列计算所有基金的风险收益指标
+    :param dates: 矩阵各行对应的交易日（升序），需包含区间起始日期之前 MAX_GAP_DAYS 天
+    :param panel: 形状为 [交易日数, 基金数] 的累计净值矩阵，缺失为 NaN
+    :param start_date_str: 区间起始日期
+    :param end_date_str: 区间结束日期
+    :param risk_free_rate: 无风险利率（%）
+    :return: 字典，包含 valid（是否有效）、total_return、annualized_return、ulcer_index、martin_ratio、max_drawdown、
+             calmar_ratio 各数组（收益率、Ulcer指数、最大回撤单位为%），无效基金的指标为 NaN
+    """
+    start_date = pd.to_datetime(start_date_str)
+    end_date = pd.to_datetime(end_date_str)
+    years = (end_date - start_date).days / 365
+
+    # 起止日期对齐到当天或之前最近的交易日
+    start_row, end_row = trading_calendar.prior_positions(dates, [start_date, end_date])
+    if start_row < 0:
+        return _column_metrics(panel, ~np.isnan(panel), np.zeros(panel.shape[1], dtype=bool), years, risk_free_rate)
+    return _window_metrics(dates[:end_row + 1], panel[:end_row + 1], start_row, years, risk_free_rate)
+
+
+def _window_metrics(dates, panel, start_row, years, risk_free_rate):
+    """
+    计算从 start_row 到矩阵最后一行的区间指标；基金在起止行没有净值时沿用之前最近的净值
+    :param dates: 矩阵各行对应的交易日
+    :param panel: 累计净值矩阵，最后一行为区间结束日期
+    :param start_row: 区间起始日期所在行
+    """
+    values = trading_calendar.forward_fill(dates, panel)[start_row:]
+    mask = ~np.isnan(panel[start_row:])
+    # 期初净值按区间起始日期的净值计入（沿用的之前净值即基金自己的期初净值）
+    mask[0] = True
+    valid = ~np.isnan(values[0]) & ~np.isnan(values[-1])
+    return _column_metrics(values, mask, valid, years, risk_free_rate)
+
+
+def _column_metrics(panel, mask, valid, years, risk_free_rate):
+    """
+    对矩阵中有效的列计算各项指标
+    :param panel: 累计净值矩阵，第一行为期初净值、最后一行为期末净值
+    :param mask: 与矩阵同形状，标记参与Ulcer指数和最大回撤计算的日期
+    :param valid: 需要计算的列
+    :param years: 区间年限
+    :param risk_free_rate: 无风险利率（%）
+    :return: 指标字典，无效列为 NaN
+    """
+    n_funds = panel.shape[1]
+    result = {'valid': valid}
+    for key in ['total_return', 'annualized_return', 'ulcer_index', 'martin_ratio', 'max_drawdown', 'calmar_ratio']:
+        result[key] = np.full(n_funds, np.nan)
+    if not valid.any():
+        return result
+
+    values = panel[:, valid]
+    mask = mask[:, valid]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 区间收益率和年化收益率
+        total_return = values[-1] / values[0]
+        annualized_return = (total_return ** (1 / years) - 1) * 100
+
+        # 以期初净值为基准的累计增长，按列计算峰值（缺失日期不影响峰值）
+        cumulative_returns = values / values[0]
+        peak = np.fmax.accumulate(cumulative_returns, axis=0)
+        drawdown = np.where(mask, (peak - cumulative_returns) / peak, 0.0)
+
+        # Ulcer指数：只对有净值的日期求回撤平方的均值
+        ulcer_index = np.sqrt((drawdown ** 2).sum(axis=0) / mask.sum(axis=0)) * 100
+        martin_ratio = (annualized_return - risk_free_rate) / ulcer_index
+        max_drawdown = drawdown.max(axis=0) * 100
+        calmar_ratio = annualized_return / max_drawdown
+
+    result['total_return'][valid] = (total_return - 1) * 100
+    result['annualized_return'][valid] = annualized_return
+    result['ulcer_index'][valid] = ulcer_index
+    result['martin_ratio'][valid] = martin_ratio
+    result['max_drawdown'][valid] = max_drawdown
+    result['calmar_ratio'][valid] = calmar_ratio
+    return result
+
+
+def evaluate_panel(navs, start_date_str, end_date_str, risk_free_rate):
+    """
+    批量计算多只基金的风险收益指标
+    :param navs: {基金代码: 含净值日期、累计净值两列的DataFrame}，或 compact_nav.CompactNav
+    :param start_date_str: 区间起始日期
+    :param end_date_str: 区间结束日期
+    :param risk_free_rate: 无风险利率（%）
+    :return: DataFrame，每只有效基金一行：基金代码、年化收益率(%)、Ulcer指数(%)、Martin Ratio、最大回撤(%)
+    """
+    dates, codes, panel = build_panel(navs, window_begin(start_date_str), end_date_str)
+    report_alignment(dates, start_date_str, end_date_str)
+    return metrics_frame(codes, panel_metrics(dates, panel, start_date_str, end_date_str, risk_free_rate))
+
+
+def window_begin(start_date_str):
+    """区间矩阵需要从起始日期往前多载入 MAX_GAP_DAYS 天，用于取起始日期当天或之前最近的净值"""
+    return pd.to_datetime(start_date_str) - pd.Timedelta(days=trading_calendar.MAX_GAP_DAYS)
+
+
+def report_alignment(dates, start_date_str, end_date_str):
+    """起止日期不是交易日时输出实际使用的交易日"""
+    for label, date_str in [('起始', start_date_str), ('结束', end_date_str)]:
+        aligned = trading_calendar.align_dates(dates, [date_str])[0]
+        if pd.notna(aligned) and aligned != pd.to_datetime(date_str):
+            print(f"区间{label}日期 {date_str} 不是交易日，按之前最近的交易日 {aligned.date()} 的净值计算")
+
+
+def metrics_frame(codes, metrics):
+    """把 panel_metrics 的结果整理为每只有效基金一行的DataFrame"""
+    valid = metrics['valid']
+    return pd.DataFrame({
+        '基金代码': [str(code).zfill(6) for code, ok in zip(codes, valid) if ok],
+        '年化收益率(%)': metrics['annualized_return'][valid],
+        'Ulcer指数(%)': metrics['ulcer_index'][valid],
+        'Martin Ratio': metrics['martin_ratio'][valid],
+        '最大回撤(%)': metrics['max_drawdown'][valid],
+    })
+
+
+def _horizon_metrics(dates, panel, end_date, horizons, metrics, risk_free_rate):
+    """
+    计算截止到 end_date（矩阵最后一行不晚于该日期）的各区间指标
+    :return: {列名: 数组}
+    """
+    start_dates = [end_date - pd.DateOffset(months=HORIZONS[horizon]) for horizon in horizons]
+    start_rows = trading_calendar.prior_positions(dates, start_dates)
+    result = {}
+    for horizon, start_date, start_row in zip(horizons, start_dates, start_rows):
+        years = (end_date - start_date).days / 365
+        if start_row < 0:
+            valid = np.zeros(panel.shape[1], dtype=bool)
+            horizon_metrics = _column_metrics(panel, ~np.isnan(panel), valid, years, risk_free_rate)
+        else:
+            horizon_metrics = _window_metrics(dates, panel, start_row, years, risk_free_rate)
+        for metric in metrics:
+            result[f"{horizon}{METRIC_COLUMNS[metric]}"] = horizon_metrics[METRIC_KEYS[metric]]
+    return result
+
+
+def _latest_dates(navs):
+    """各基金最新的净值日期（没有净值的基金不计入）"""
+    if isinstance(navs, compact_nav.CompactNav):
+        lengths = np.diff(navs.offsets)
+        last_days = navs.days[navs.offsets[1:][lengths > 0] - 1]
+        return list(pd.to_datetime(compact_nav.EPOCH + last_days.astype('timedelta64[D]')))
+    return [pd.to_datetime(fund_data['净值日期'].max()) for fund_data in navs.values()
+            if fund_data is not None and not fund_data.empty]
+
+
+def multi_horizon_metrics(navs, horizons=None, metrics=None, end_date_str=None, risk_free_rate=1.5):
+    """
+    一次载入净值，计算截止日期前多个回看区间的指标
+    :param navs: {基金代码: 含净值日期、累计净值两列的DataFrame}，或 compact_nav.CompactNav
+    :param horizons: 区间名称列表（HORIZONS 中的键），默认全部
+    :param metrics: 指标名称列表（METRIC_COLUMNS 中的键），默认全部
+    :param end_date_str: 截止日期，默认为每只基金自己最新的净值日期（结果不受同批其他基金影响）
+    :param risk_free_rate: 无风险利率（%）
+    :return: DataFrame：基金代码，以及每个区间、每个指标一列（列名如 近1年收益率(%)）；
+             净值历史不足的区间为 NaN，基金没有任何净值时整行为 NaN
+    """
+    horizons = list(HORIZONS) if horizons is None else list(horizons)
+    metrics = list(METRIC_COLUMNS) if metrics is None else list(metrics)
+    is_compact = isinstance(navs, compact_nav.CompactNav)
+    codes = [str(code).zfill(6) for code in (navs.codes if is_compact else navs)]
+    columns = ['基金代码'] + [f"{horizon}{METRIC_COLUMNS[metric]}" for horizon in horizons for metric in metrics]
+    if not horizons:
+        return pd.DataFrame({'基金代码': codes}, columns=columns)
+
+    if end_date_str is None:
+        latest = _latest_dates(navs)
+        if not latest:
+            return pd.DataFrame({'基金代码': codes}, columns=columns)
+        first_end, end_date = min(latest), max(latest)
+    else:
+        first_end = end_date = pd.to_datetime(end_date_str)
+
+    # 只载入一次覆盖最长区间的净值矩阵；期初多留一段，用于取区间起始日期当天或之前最近的净值
+    longest = max(HORIZONS[horizon] for horizon in horizons)
+    lookback = pd.Timedelta(days=trading_calendar.MAX_GAP_DAYS)
+    dates, panel_codes, panel = build_panel(navs, first_end - pd.DateOffset(months=longest) - lookback, end_date)
+    if panel.size == 0:
+        return pd.DataFrame({'基金代码': codes}, columns=columns)
+
+    result = pd.DataFrame({'基金代码': [str(code).zfill(6) for code in panel_codes]})
+    for column in columns[1:]:
+        result[column] = np.nan
+
+    if end_date_str is None:
+        # 每只基金截止到自己最后一个净值所在行，截止日期相同的基金一起计算
+        has_nav = ~np.isnan(panel)
+        end_rows = len(dates) - 1 - np.argmax(has_nav[::-1], axis=0)
+        end_rows[~has_nav.any(axis=0)] = -1
+        groups = [(end_row, dates[end_row], np.flatnonzero(end_rows == end_row))
+                  for end_row in np.unique(end_rows) if end_row >= 0]
+    else:
+        groups = [(len(dates) - 1, end_date, np.arange(panel.shape[1]))]
+
+    for end_row, group_end, group_columns in groups:
+        block = _horizon_metrics(dates[:end_row + 1], panel[:end_row + 1, group_columns], group_end, horizons, metrics,
+                                 risk_free_rate)
+        for column, values in block.items():
+            result.loc[group_columns, column] = values
+
+    # 没有任何净值的基金也保留一行
+    return pd.DataFrame({'基金代码': codes}).merge(result, on='基金代码', how='left')[columns]
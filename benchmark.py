@@ -0,0 +1,377 @@
+"""
+指标计算和各步骤热点代码的基准测试（离线）
+
+功能概述：
+- 用随机生成的净值序列和基金表（规模可设置，如 1000~100000 只基金、250~5000 个交易日）运行各项计算，不访问网络
+- 每项输出每秒执行次数、每秒处理的基金数、单次内存分配量和峰值内存
+- 结果可保存为基准线（benchmark_baseline.json），之后运行时与相同规模的基准线比较，变慢或内存增加超过阈值时标记为回退
+
+测试项目：
+- ulcer_index / annualized_return / evaluate_fund：第3步逐只基金的计算函数（单只基金）
+- join_fund_info / filter_buyable_funds：第2步按基金代码关联申购信息和整步筛选（申购状态表预先写入临时缓存目录）
+- established_before：第1步成立年限的向量化判断
+- compact_nav / panel_metrics：第3步批量计算（构建紧凑容器、对齐矩阵并计算指标）
+- multi_horizon：第4步多区间收益率
+- rolling_metrics / online_update：单只基金的滚动窗口序列和增量更新
+- param_sweep：参数扫描的矩阵筛选
+
+测量方法：
+- 先运行一次预热，再分 ROUNDS 轮重复运行（共不少于 --min-time 秒），取最快一轮的每秒执行次数
+- 内存用 tracemalloc 单独运行一次测量（numpy数组也会被统计）：
+  单次分配 = 运行结束时新增占用的内存（含返回值），峰值内存 = 运行期间相对运行前的最高内存
+- CPython没有累计分配次数的计数器，这里以峰值内存反映临时分配的规模
+
+用法：
+python benchmark.py [--funds 1000] [--days 750] [--cases ulcer_index,panel_metrics] [--save-baseline] [--threshold 0.25]
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import batch_metrics
+import compact_nav
+import establish_index
+import fund_cache
+import online_metrics
+import param_sweep
+import rolling_metrics
+from run_pipeline import load_stage
+
+# 基准线文件，放在脚本同级目录下
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# 合成数据的区间结束日期（固定，使结果可重复）
+END_DATE = pd.Timestamp("2026-02-24")
+
+# 计时分为几轮，取最快一轮的速度，减少其他程序干扰造成的波动
+ROUNDS = 5
+
+PURCHASE_STATUSES = ["开放申购", "限大额", "暂停申购", "封闭期"]
+PURCHASE_STARTS = [10.0, 100.0, 1000.0, 10000.0]
+
+
+def synthetic_nav(n_days, rng, drift=0.0002, volatility=0.002):
+    """
+    生成一只基金的累计净值序列
+    :param n_days: 交易日数
+    :return: 含净值日期、累计净值两列的DataFrame（工作日，4位小数）
+    """
+    dates = pd.bdate_range(end=END_DATE, periods=n_days)
+    values = np.round(np.exp(np.cumsum(rng.normal(drift, volatility, n_days))), 4)
+    return pd.DataFrame({"净值日期": dates, "累计净值": values})
+
+
+def synthetic_navs(n_funds, n_days, rng):
+    """
+    生成多只基金的累计净值
+    :return: {基金代码: 净值DataFrame}；约两成基金成立较晚（历史较短），约1%的净值为空
+    """
+    dates = pd.bdate_range(end=END_DATE, periods=n_days)
+    navs = {}
+    for i in range(n_funds):
+        begin = rng.integers(0, n_days // 2) if rng.random() < 0.2 else 0
+        values = np.round(np.exp(np.cumsum(rng.normal(0.0002, 0.002, n_days - begin))), 4)
+        values[rng.random(len(values)) < 0.01] = np.nan
+        navs[f"{i:06d}"] = pd.DataFrame({"净值日期": dates[begin:], "累计净值": values})
+    return navs
+
+
+def synthetic_purchase_table(n_funds, rng):
+    """
+    生成与 fund_purchase_em 接口结构相同的申购状态表
+    :return: 覆盖 n_funds 只基金代码（另有三成其他基金）的DataFrame
+    """
+    n_rows = int(n_funds * 1.3)
+    return pd.DataFrame({
+        "基金代码": [f"{i:06d}" for i in rng.permutation(n_rows)],
+        "基金简称": [f"债券基金{i}" for i in range(n_rows)],
+        "申购状态": rng.choice(PURCHASE_STATUSES, n_rows),
+        "购买起点": rng.choice(PURCHASE_STARTS, n_rows),
+    })
+
+
+def _codes(n_funds):
+    return [f"{i:06d}" for i in range(n_funds)]
+
+
+# 各测试项目：setup(n_funds, n_days, rng) -> (执行一次的函数, 每次处理的基金数)；
+# 需要清理临时状态的项目为上下文管理器，在测量结束后恢复
+
+def setup_ulcer_index(n_funds, n_days, rng):
+    stage3 = load_stage("stage3")
+    net_values = synthetic_nav(n_days, rng)["累计净值"]
+    return lambda: stage3.calculate_ulcer_index(net_values), 1
+
+
+def setup_annualized_return(n_funds, n_days, rng):
+    stage3 = load_stage("stage3")
+    fund_data = synthetic_nav(n_days, rng)
+    net_values = fund_data["累计净值"]
+    start, end = fund_data["净值日期"].iloc[0], fund_data["净值日期"].iloc[-1]
+    return lambda: stage3.calculate_annualized_return(net_values, start, end), 1
+
+
+def setup_evaluate_fund(n_funds, n_days, rng):
+    stage3 = load_stage("stage3")
+    fund_data = synthetic_nav(n_days, rng)
+    start = str(fund_data["净值日期"].iloc[0].date())
+    end = str(END_DATE.date())
+    return lambda: stage3.evaluate_fund("000001", fund_data.copy(), start, end, 1.5), 1
+
+
+def setup_join_fund_info(n_funds, n_days, rng):
+    stage2 = load_stage("stage2")
+    all_fund_data = synthetic_purchase_table(n_funds, rng)
+    fund_codes = _codes(n_funds)
+    return lambda: stage2.join_fund_info(fund_codes, all_fund_data), n_funds
+
+
+@contextlib.contextmanager
+def setup_filter_buyable_funds(n_funds, n_days, rng):
+    stage2 = load_stage("stage2")
+    # 申购状态表写入临时缓存目录，整步筛选命中缓存，不访问网络；测量结束后恢复缓存目录并删除临时目录
+    cache_dir = fund_cache.CACHE_DIR
+    fund_cache.CACHE_DIR = tempfile.mkdtemp(prefix="bench_cache_")
+    try:
+        fund_cache.store("fund_purchase_em", {}, synthetic_purchase_table(n_funds, rng))
+        df = pd.DataFrame({"基金代码": _codes(n_funds)})
+        yield lambda: stage2.filter_buyable_funds(df.copy()), n_funds
+    finally:
+        shutil.rmtree(fund_cache.CACHE_DIR, ignore_errors=True)
+        fund_cache.CACHE_DIR = cache_dir
+
+
+def setup_established_before(n_funds, n_days, rng):
+    days_ago = rng.integers(0, 20 * 365, n_funds)
+    index = pd.Series(END_DATE - pd.to_timedelta(days_ago, unit="D"), index=_codes(n_funds), name="成立时间")
+    index = index.rename_axis("基金代码")
+    fund_codes = pd.Index(_codes(n_funds))
+    threshold = END_DATE - pd.Timedelta(days=3 * 365)
+    return lambda: establish_index.established_before(index, fund_codes, threshold), n_funds
+
+
+def setup_compact_nav(n_funds, n_days, rng):
+    navs = synthetic_navs(n_funds, n_days, rng)
+    return lambda: compact_nav.CompactNav.from_navs(navs), n_funds
+
+
+def setup_panel_metrics(n_funds, n_days, rng):
+    navs = compact_nav.CompactNav.from_navs(synthetic_navs(n_funds, n_days, rng))
+    start = str((END_DATE - pd.DateOffset(days=int(n_days * 0.8 * 365 / 250))).date())
+    end = str(END_DATE.date())
+
+    def run():
+        dates, _, panel = batch_metrics.build_panel(navs, batch_metrics.window_begin(start), end)
+        return batch_metrics.panel_metrics(dates, panel, start, end, 1.5)
+
+    return run, n_funds
+
+
+def setup_multi_horizon(n_funds, n_days, rng):
+    navs = compact_nav.CompactNav.from_navs(synthetic_navs(n_funds, n_days, rng))
+    return lambda: batch_metrics.multi_horizon_metrics(navs, ["近3月", "近1年"], ["收益率"],
+                                                       str(END_DATE.date())), n_funds
+
+
+def setup_rolling_metrics(n_funds, n_days, rng):
+    fund_data = synthetic_nav(n_days, rng)
+    return lambda: rolling_metrics.rolling_metrics(fund_data, years=1, freq="D"), 1
+
+
+def setup_online_update(n_funds, n_days, rng):
+    # 先填满一个窗口，之后每次加入一个新交易日并计算指标
+    fund_data = synthetic_nav(n_days, rng)
+    state = online_metrics.SlidingUlcer(1)
+    state.extend(fund_data)
+
+    def new_points():
+        # 逐个生成新交易日的净值，调用多少次就生成多少个，日期不会超出取值范围
+        value = fund_data["累计净值"].iloc[-1]
+        for step in itertools.count(1):
+            value *= np.exp(rng.normal(0.0002, 0.002))
+            yield END_DATE + pd.offsets.BDay(step), value
+
+    points = new_points()
+
+    def run():
+        state.update(*next(points))
+        return state.metrics(1.5)
+
+    return run, 1
+
+
+def setup_param_sweep(n_funds, n_days, rng):
+    funds = synthetic_purchase_table(n_funds, rng).iloc[:n_funds].copy()
+    funds["年化收益率(%)"] = rng.normal(4, 2, n_funds)
+    funds["Ulcer指数(%)"] = rng.uniform(0.2, 2, n_funds)
+    grids = {
+        "risk_free_rate": [1.0, 1.5, 2.0],
+        "min_return": [3.0, 3.5, 4.0],
+        "max_return": [10.0],
+        "min_martin": [3.0, 3.5, 4.0],
+        "max_purchase": [100.0, 1000.0],
+    }
+    return lambda: param_sweep.sweep(funds, grids, ["封闭期", "暂停申购"]), n_funds
+
+
+BENCHMARKS = {
+    "ulcer_index": setup_ulcer_index,
+    "annualized_return": setup_annualized_return,
+    "evaluate_fund": setup_evaluate_fund,
+    "join_fund_info": setup_join_fund_info,
+    "filter_buyable_funds": setup_filter_buyable_funds,
+    "established_before": setup_established_before,
+    "compact_nav": setup_compact_nav,
+    "panel_metrics": setup_panel_metrics,
+    "multi_horizon": setup_multi_horizon,
+    "rolling_metrics": setup_rolling_metrics,
+    "online_update": setup_online_update,
+    "param_sweep": setup_param_sweep,
+}
+
+
+def measure(run, min_time=1.0):
+    """
+    测量一个函数的执行速度和内存
+    :param run: 无参数函数
+    :param min_time: 计时的最少累计秒数
+    :return: (每秒执行次数, 单次分配MB, 峰值内存MB)
+    """
+    # 被测函数的进度输出不计入结果
+    with contextlib.redirect_stdout(io.StringIO()):
+        run()
+        rates = []
+        for _ in range(ROUNDS):
+            calls = 0
+            start_time = time.perf_counter()
+            while True:
+                run()
+                calls += 1
+                elapsed = time.perf_counter() - start_time
+                if elapsed >= min_time / ROUNDS:
+                    break
+            rates.append(calls / elapsed)
+
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = run()
+            current, peak = tracemalloc.get_traced_memory()
+            del result
+        finally:
+            tracemalloc.stop()
+    return max(rates), (current - before) / 2 ** 20, (peak - before) / 2 ** 20
+
+
+def load_baseline():
+    """读取基准线：{项目|基金数|交易日数: 测量结果}"""
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(baseline):
+    tmp_path = f"{BASELINE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, BASELINE_PATH)
+
+
+def _open_case(case):
+    """把 setup 的返回值统一为上下文管理器（直接返回 (执行函数, 基金数) 的项目不需要清理）"""
+    if isinstance(case, contextlib.AbstractContextManager):
+        return case
+    return contextlib.nullcontext(case)
+
+
+def run_benchmarks(cases, n_funds, n_days, min_time=1.0, threshold=0.25, seed=0):
+    """
+    运行基准测试并与基准线比较
+    :param cases: 测试项目名称列表
+    :param n_funds: 基金数
+    :param n_days: 交易日数
+    :param min_time: 每项计时的最少累计秒数
+    :param threshold: 回退阈值（0.25 表示变慢或内存增加超过25%）
+    :param seed: 随机数种子
+    :return: (结果DataFrame, 本次测量的基准线记录)
+    """
+    baseline = load_baseline()
+    rows = []
+    records = {}
+    for name in cases:
+        rng = np.random.default_rng(seed)
+        with _open_case(BENCHMARKS[name](n_funds, n_days, rng)) as (run, funds_per_call):
+            ops, allocated, peak = measure(run, min_time)
+        key = f"{name}|{n_funds}|{n_days}"
+        records[key] = {"每秒次数": ops, "单次分配(MB)": allocated, "峰值内存(MB)": peak,
+                        "记录时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+        base = baseline.get(key)
+        status = ""
+        change = np.nan
+        if base is not None:
+            change = (ops / base["每秒次数"] - 1) * 100
+            flags = []
+            if ops < base["每秒次数"] * (1 - threshold):
+                flags.append("变慢")
+            # 内存很小时的波动不计
+            if peak > max(base["峰值内存(MB)"] * (1 + threshold), base["峰值内存(MB)"] + 1):
+                flags.append("内存增加")
+            status = "回退：" + "、".join(flags) if flags else "正常"
+        rows.append([name, ops, ops * funds_per_call, allocated, peak, change, status])
+        print(f"{name}：{ops:,.1f} 次/秒，峰值内存 {peak:.2f} MB {status}")
+
+    result = pd.DataFrame(rows, columns=["项目", "每秒次数", "每秒基金数", "单次分配(MB)", "峰值内存(MB)",
+                                         "较基准线(%)", "状态"])
+    return result, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线运行指标计算和各步骤热点代码的基准测试")
+    parser.add_argument("--funds", type=int, default=1000, help="合成基金数，默认 1000")
+    parser.add_argument("--days", type=int, default=750, help="每只基金的交易日数，默认 750")
+    parser.add_argument("--cases", help="逗号分隔的测试项目，默认全部：" + ",".join(BENCHMARKS))
+    parser.add_argument("--min-time", type=float, default=1.0, help="每项计时的最少秒数，默认 1")
+    parser.add_argument("--threshold", type=float, default=0.25, help="回退阈值，默认 0.25（25%%）")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基准线")
+    args = parser.parse_args()
+
+    cases = args.cases.split(",") if args.cases else list(BENCHMARKS)
+    unknown = [name for name in cases if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的测试项目：{','.join(unknown)}")
+
+    print(f"合成数据：{args.funds} 只基金，每只 {args.days} 个交易日\n")
+    result, records = run_benchmarks(cases, args.funds, args.days, args.min_time, args.threshold, args.seed)
+    print()
+    print(result.to_string(index=False, float_format=lambda x: f"{x:,.3f}"))
+
+    if args.save_baseline:
+        baseline = load_baseline()
+        baseline.update(records)
+        save_baseline(baseline)
+        print(f"\n基准线已保存到：{BASELINE_PATH}")
+
+    # 有回退时以非零状态退出，便于在脚本中检查
+    if result["状态"].str.startswith("回退").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
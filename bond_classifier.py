@@ -0,0 +1,122 @@
+"""
+债券基金分类
+
+功能概述：
+- 对 fund_name_em 返回的全市场基金表一次性分类，不逐只基金处理
+- 结合基金类型列和基金简称中的关键字，给出每只基金的债券子类（纯债、短债、可转债、债券ETF等）
+- 可转债基金、债券ETF和联接基金默认排除，在第1步请求成立时间之前就去掉，
+  不再为它们请求基金基本信息和下载净值
+
+分类规则：
+- 入选范围：基金类型以"债券型"开头，或基金简称含 INCLUDE_KEYWORDS 中的关键字
+- 子类按 CATEGORY_RULES 的顺序匹配，基金简称或基金类型含对应关键字即归入该类，都不匹配时为"其他债券"
+- 关键字集合预先编译为正则表达式，对整列做一次匹配
+
+用法：
+python bond_classifier.py [--export 债券基金分类.xlsx]
+"""
+
+import argparse
+import re
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from fund_cache import cached_call
+
+# 基金简称含这些关键字的基金进入分类范围
+INCLUDE_KEYWORDS = ["债"]
+
+# 按顺序匹配的子类规则：(子类, 基金简称关键字, 基金类型关键字)
+CATEGORY_RULES = [
+    ("联接基金", ["联接"], []),
+    ("可转债", ["转债"], ["可转债"]),
+    ("债券ETF", ["ETF"], []),
+    ("债券指数", ["指数"], ["指数型"]),
+    ("海外债券", ["美元", "QDII"], ["QDII"]),
+    ("债券FOF", ["FOF"], ["FOF"]),
+    ("短债", ["短债", "超短"], ["中短债"]),
+    ("纯债", ["纯债", "长债"], ["长债"]),
+    ("一级债", [], ["混合一级"]),
+    ("二级债", [], ["混合二级"]),
+    ("偏债混合", ["偏债"], ["混合型"]),
+]
+
+# 默认排除的子类
+EXCLUDED_CATEGORIES = ["可转债", "债券ETF", "联接基金"]
+
+DEFAULT_CATEGORY = "其他债券"
+
+
+def _compile(keywords):
+    """把关键字集合编译为一个正则表达式，没有关键字时返回 None"""
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+
+_INCLUDE_PATTERN = _compile(INCLUDE_KEYWORDS)
+_COMPILED_RULES = [(category, _compile(names), _compile(types)) for category, names, types in CATEGORY_RULES]
+
+
+def _matches(values, pattern):
+    if pattern is None:
+        return np.zeros(len(values), dtype=bool)
+    return values.str.contains(pattern, na=False).to_numpy()
+
+
+def classify(all_funds):
+    """
+    对基金表分类
+    :param all_funds: fund_name_em 返回的DataFrame（含基金简称列，基金类型列可选）
+    :return: 与 all_funds 行对齐的DataFrame：债券分类（不是债券基金的为 None）
+    """
+    names = all_funds["基金简称"].astype(str)
+    if "基金类型" in all_funds.columns:
+        types = all_funds["基金类型"].fillna("").astype(str)
+    else:
+        types = pd.Series("", index=all_funds.index)
+
+    is_bond = _matches(names, _INCLUDE_PATTERN) | types.str.startswith("债券型").to_numpy()
+    conditions = [_matches(names, name_pattern) | _matches(types, type_pattern)
+                  for _, name_pattern, type_pattern in _COMPILED_RULES]
+    categories = np.select(conditions, [category for category, _, _ in _COMPILED_RULES], DEFAULT_CATEGORY)
+    categories = np.where(is_bond, categories.astype(object), None)
+    return pd.DataFrame({"债券分类": categories}, index=all_funds.index)
+
+
+def select_bond_funds(all_funds, excluded_categories=EXCLUDED_CATEGORIES):
+    """
+    选出债券基金并排除不需要的子类
+    :param all_funds: fund_name_em 返回的DataFrame
+    :param excluded_categories: 需要排除的子类
+    :return: (保留的基金（在原表基础上增加债券分类列）, 各子类基金数的Series，排除的子类也计入)
+    """
+    classified = all_funds.assign(债券分类=classify(all_funds)["债券分类"])
+    bond_funds = classified[classified["债券分类"].notna()]
+    counts = bond_funds["债券分类"].value_counts()
+    return bond_funds[~bond_funds["债券分类"].isin(excluded_categories)], counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对全市场基金做债券子类分类")
+    parser.add_argument("--export", dest="excel_path", help="把分类结果导出为Excel")
+    args = parser.parse_args()
+
+    all_funds = cached_call(ak.fund_name_em)
+    all_funds["基金代码"] = all_funds["基金代码"].astype(str).str.zfill(6)
+    bond_funds, counts = select_bond_funds(all_funds, excluded_categories=[])
+
+    print(f"全市场基金 {len(all_funds)} 只，其中债券基金 {len(bond_funds)} 只\n")
+    for category, count in counts.items():
+        mark = "（默认排除）" if category in EXCLUDED_CATEGORIES else ""
+        print(f"{category}：{count} 只{mark}")
+
+    if args.excel_path:
+        bond_funds[["基金代码", "基金简称", "基金类型", "债券分类"]].to_excel(args.excel_path, index=False)
+        print(f"分类结果已导出到：{args.excel_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+步骤断点续跑日志
+
+功能概述：
+- 每个步骤一个只追加的日志文件，逐只基金写入处理结果，结果一到就写入文件
+- 程序中途中断（网络故障、Ctrl-C等）后，使用 --resume 运行时跳过日志中已完成的基金
+- 日志首行记录本次运行的参数（如计算区间），参数不一致时不续跑，避免混用不同口径的结果
+- 步骤正常完成后删除日志，下次运行重新开始
+
+日志文件：
+- checkpoints/<步骤名>.jsonl：首行为参数，之后每行一只基金 {"code": 基金代码, "ok": 是否成功, "record": 结果}
+"""
+
+import json
+import os
+
+# 日志目录，放在脚本同级目录下
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+
+
+class StageJournal:
+    """单个步骤的断点续跑日志"""
+
+    def __init__(self, name, params=None, resume=False):
+        """
+        :param name: 步骤名，例如 stage3
+        :param params: 影响结果的运行参数（需可JSON序列化），续跑时必须一致
+        :param resume: 是否从已有日志续跑；为 False 时清空旧日志
+        """
+        self.name = name
+        self.params = params or {}
+        self.path = os.path.join(CHECKPOINT_DIR, f"{name}.jsonl")
+        self.entries = {}
+
+        if resume:
+            self._load()
+        self._file = self._open(append=bool(self.entries))
+        if self.entries:
+            print(f"{name}：从断点续跑，已完成 {len(self.done_codes())} 只基金")
+
+    def _load(self):
+        """读取已有日志；参数不一致时放弃续跑。中断时可能残留不完整的最后一行，直接跳过"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.readlines()
+        if not lines:
+            return
+        try:
+            header = json.loads(lines[0])
+        except json.JSONDecodeError:
+            return
+        if header.get("params") != json.loads(json.dumps(self.params, default=str)):
+            print(f"{self.name}：断点日志的运行参数与本次不一致，重新开始")
+            return
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.entries[entry["code"]] = entry
+
+    def _open(self, append):
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        if append:
+            return open(self.path, "a", encoding="utf-8")
+        f = open(self.path, "w", encoding="utf-8")
+        f.write(json.dumps({"params": self.params}, ensure_ascii=False, default=str) + "\n")
+        f.flush()
+        return f
+
+    def append(self, code, record, ok=True):
+        """
+        写入一只基金的结果并立即刷新到文件（进程崩溃或被强制结束时已写入的结果不会丢失）
+        :param code: 基金代码
+        :param record: 结果（需可JSON序列化）
+        :param ok: 是否处理成功；失败的基金在续跑时会重新处理
+        """
+        entry = {"code": code, "ok": ok, "record": record}
+        self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        self.entries[code] = entry
+
+    def done_codes(self):
+        """已成功处理的基金代码"""
+        return {code for code, entry in self.entries.items() if entry["ok"]}
+
+    def records(self, ok_only=True):
+        """{基金代码: 结果}"""
+        return {code: entry["record"] for code, entry in self.entries.items() if entry["ok"] or not ok_only}
+
+    def finish(self):
+        """步骤正常完成：关闭并删除日志"""
+        self._file.close()
+        os.remove(self.path)
+
+    def close(self):
+        """步骤中断：只关闭日志，保留已写入的结果供续跑"""
+        if not self._file.closed:
+            self._file.close()
@@ -0,0 +1,141 @@
+"""
+紧凑的多基金累计净值容器
+
+功能概述：
+- 把多只基金的净值序列拼接到连续的数组中（CSR结构），不再每只基金一个DataFrame
+- 日期保存为距共同起点（1990-01-01）的天数（uint16，2 字节，可表示到2169年）
+- 累计净值乘以 10000 后保存为 int32（4 字节）；数据源的累计净值为4位小数，换算无损
+- 每只基金一个偏移量，指向连续数组中的起止位置；按基金切片或分批都不复制数据
+- 每个净值点 6 字节：约为datetime64 + float64 两列DataFrame（16 字节）的 3/8，
+  为接口原始返回的DataFrame（日期为Python对象，每点约 50 字节）的八分之一左右
+- 可整体写入一块连续内存（共享内存），在其他进程中按原布局零拷贝还原
+
+数组布局：
+- offsets：int64，长度为基金数+1，第 i 只基金的数据位于 [offsets[i], offsets[i+1])
+- days：uint16，距 EPOCH 的天数，每只基金内按日期升序
+- values：int32，累计净值 × VALUE_SCALE
+"""
+
+import numpy as np
+import pandas as pd
+
+# 日期的共同起点
+EPOCH = np.datetime64('1990-01-01', 'D')
+
+# 累计净值的换算倍数（4位小数）
+VALUE_SCALE = 10000
+
+
+class CompactNav:
+    """多只基金累计净值的CSR容器"""
+
+    def __init__(self, codes, offsets, days, values):
+        """
+        :param codes: 基金代码列表
+        :param offsets: int64 偏移量数组，长度为基金数+1
+        :param days: uint16 日期数组（距 EPOCH 的天数）
+        :param values: int32 累计净值数组（× VALUE_SCALE）
+        """
+        self.codes = list(codes)
+        self.offsets = offsets
+        self.days = days
+        self.values = values
+
+    @classmethod
+    def from_navs(cls, navs, start_date_str=None, end_date_str=None):
+        """
+        由 {基金代码: 含净值日期、累计净值两列的DataFrame} 构建；没有净值的基金不计入，累计净值为空的日期不保存
+        :param start_date_str: 只保存该日期（含）之后的净值，默认全部
+        :param end_date_str: 只保存该日期（含）之前的净值，默认全部
+        """
+        first = np.datetime64(pd.to_datetime(start_date_str).date()) if start_date_str is not None else EPOCH
+        last = np.datetime64(pd.to_datetime(end_date_str).date()) if end_date_str is not None else None
+        codes = []
+        day_parts = []
+        value_parts = []
+        for fund_code, fund_data in navs.items():
+            if fund_data is None or fund_data.empty:
+                continue
+            values = fund_data['累计净值'].to_numpy(dtype=np.float64)
+            dates = fund_data['净值日期'].to_numpy(dtype='datetime64[D]')
+            keep = ~np.isnan(values) & (dates >= first)
+            if last is not None:
+                keep &= dates <= last
+            codes.append(fund_code)
+            day_parts.append((dates[keep] - EPOCH).astype(np.uint16))
+            value_parts.append(np.round(values[keep] * VALUE_SCALE).astype(np.int32))
+
+        lengths = np.array([len(part) for part in day_parts], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        days = np.concatenate(day_parts) if day_parts else np.empty(0, dtype=np.uint16)
+        values = np.concatenate(value_parts) if value_parts else np.empty(0, dtype=np.int32)
+        return cls(codes, offsets, days, values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        """三个数组占用的字节数"""
+        return self.offsets.nbytes + self.days.nbytes + self.values.nbytes
+
+    def fund(self, i):
+        """
+        第 i 只基金的数据（不复制）
+        :return: (基金代码, uint16 天数数组, int32 净值数组)
+        """
+        begin, end = self.offsets[i], self.offsets[i + 1]
+        return self.codes[i], self.days[begin:end], self.values[begin:end]
+
+    def dates(self, i):
+        """第 i 只基金的净值日期（datetime64[ns]）"""
+        return (EPOCH + self.fund(i)[1].astype('timedelta64[D]')).astype('datetime64[ns]')
+
+    def nav_values(self, i):
+        """第 i 只基金的累计净值（float64）"""
+        return self.fund(i)[2] / VALUE_SCALE
+
+    def to_frame(self, i):
+        """第 i 只基金还原为含净值日期、累计净值两列的DataFrame"""
+        return pd.DataFrame({'净值日期': self.dates(i), '累计净值': self.nav_values(i)})
+
+    def chunks(self, size):
+        """按基金分批（不复制数据），每批不超过 size 只基金"""
+        for start in range(0, len(self), size):
+            stop = min(start + size, len(self))
+            begin, end = self.offsets[start], self.offsets[stop]
+            yield CompactNav(self.codes[start:stop], self.offsets[start:stop + 1] - begin,
+                             self.days[begin:end], self.values[begin:end])
+
+    def layout(self):
+        """写入连续内存时的布局：(基金数, 净值点数, 总字节数)"""
+        n_points = len(self.days)
+        return len(self), n_points, _layout(len(self), n_points)[2]
+
+    def write_into(self, buffer):
+        """按布局把三个数组写入连续内存（如共享内存的 buf）"""
+        offsets, days, values = _views(buffer, len(self), len(self.days))
+        offsets[:] = self.offsets
+        days[:] = self.days
+        values[:] = self.values
+
+    @classmethod
+    def from_buffer(cls, codes, buffer, n_points):
+        """按布局从连续内存还原（不复制，返回的对象在内存释放前有效）"""
+        return cls(codes, *_views(buffer, len(codes), n_points))
+
+
+def _layout(n_funds, n_points):
+    """连续内存布局：offsets(int64) | days(uint16，补齐到4字节) | values(int32)，返回 (days起点, values起点, 总字节数)"""
+    days_at = 8 * (n_funds + 1)
+    values_at = days_at + (2 * n_points + 3) // 4 * 4
+    return days_at, values_at, values_at + 4 * n_points
+
+
+def _views(buffer, n_funds, n_points):
+    """连续内存中的三个数组（不复制）"""
+    days_at, values_at, _ = _layout(n_funds, n_points)
+    offsets = np.ndarray(n_funds + 1, dtype=np.int64, buffer=buffer, offset=0)
+    days = np.ndarray(n_points, dtype=np.uint16, buffer=buffer, offset=days_at)
+    values = np.ndarray(n_points, dtype=np.int32, buffer=buffer, offset=values_at)
+    return offsets, days, values
@@ -0,0 +1,183 @@
+"""
+两级执行器：I/O层与计算层分离
+
+功能概述：
+- I/O层：异步引擎并发更新净值（nav_store.refresh_many），每到一批基金就转为紧凑容器（compact_nav.py）写入共享内存
+- 计算层：进程池（进程数默认为物理核心数）挂载共享内存中的紧凑容器，构建矩阵并计算指标，净值序列不经过pickle
+- 计算在其他进程中进行，不与事件循环争用GIL；网络并发数和计算进程数分别设置，互不影响
+- 每批大小适中（默认256只基金，只保留计算区间内的净值，紧凑容器约1.2MB），便于放入CPU缓存
+- 进程数为0时在当前进程内计算（基金很少时省去启动进程的开销）
+- 每批结果取回后立即交给 on_chunk 回调（如写入断点日志），不必等所有基金计算完成
+
+说明：
+- 每批基金使用该批净值日期的并集作为交易日历；各基金取到的期初、期末净值与一次性计算所有基金时相同
+
+使用方式：
+with ComputePool(start_date_str, end_date_str, risk_free_rate) as pool:
+    nav_store.refresh_many(fund_codes, on_result=pool.add)
+    metrics_df = pool.results()
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pandas as pd
+
+import batch_metrics
+import compact_nav
+import trading_calendar
+
+# 每批交给计算进程的基金数
+CHUNK_FUNDS = 256
+
+RESULT_COLUMNS = ['基金代码', '年化收益率(%)', 'Ulcer指数(%)', 'Martin Ratio', '最大回撤(%)']
+
+
+def physical_cores():
+    """物理核心数（安装了psutil时使用，否则退回逻辑核心数）"""
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+    except ImportError:
+        cores = None
+    return cores or os.cpu_count() or 1
+
+
+def _chunk_metrics(navs, start_date_str, end_date_str, risk_free_rate):
+    """
+    对一批基金计算指标
+    :param navs: compact_nav.CompactNav
+    :return: (指标字典, 起止日期对齐后的交易日)
+    """
+    dates, _, panel = batch_metrics.build_panel(navs, batch_metrics.window_begin(start_date_str), end_date_str)
+    metrics = batch_metrics.panel_metrics(dates, panel, start_date_str, end_date_str, risk_free_rate)
+    return metrics, trading_calendar.align_dates(dates, [start_date_str, end_date_str])
+
+
+def _shared_chunk_metrics(shm_name, codes, n_points, start_date_str, end_date_str, risk_free_rate):
+    """计算进程：挂载共享内存中的紧凑净值容器并计算指标，只把结果返回给主进程"""
+    # 进程池的子进程与主进程共用资源跟踪进程，共享内存由主进程在取回结果后释放
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        navs = compact_nav.CompactNav.from_buffer(codes, shm.buf, n_points)
+        result = _chunk_metrics(navs, start_date_str, end_date_str, risk_free_rate)
+        del navs
+    finally:
+        shm.close()
+    return result
+
+
+class ComputePool:
+    """计算层：按批接收净值，在进程池中计算指标"""
+
+    def __init__(self, start_date_str, end_date_str, risk_free_rate, workers=None, chunk_funds=CHUNK_FUNDS,
+                 on_chunk=None):
+        """
+        :param start_date_str: 区间起始日期
+        :param end_date_str: 区间结束日期
+        :param risk_free_rate: 无风险利率（%）
+        :param workers: 计算进程数，默认为物理核心数；为0时在当前进程内计算
+        :param chunk_funds: 每批基金数
+        :param on_chunk: 每批结果取回时的回调 on_chunk(该批基金代码列表, 该批有效基金的指标DataFrame)
+        """
+        self.start_date_str = start_date_str
+        self.end_date_str = end_date_str
+        self.risk_free_rate = risk_free_rate
+        self.workers = physical_cores() if workers is None else workers
+        self.chunk_funds = chunk_funds
+        self._executor = ProcessPoolExecutor(self.workers) if self.workers > 0 else None
+        self.on_chunk = on_chunk
+        self._pending = {}
+        self._jobs = []
+        self._frames = []
+        self._aligned_dates = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, fund_code, fund_data):
+        """
+        接收一只基金的净值（可直接作为 nav_store.refresh_many 的 on_result 回调），凑满一批后提交计算
+        :param fund_code: 基金代码
+        :param fund_data: 净值DataFrame；为 None 或空时忽略
+        """
+        if fund_data is None or fund_data.empty:
+            return
+        self._pending[fund_code] = fund_data
+        if len(self._pending) >= self.chunk_funds:
+            self._submit()
+        self._collect(wait=False)
+
+    def _submit(self):
+        navs = compact_nav.CompactNav.from_navs(self._pending, batch_metrics.window_begin(self.start_date_str),
+                                                self.end_date_str)
+        self._pending = {}
+
+        if self._executor is None:
+            result = _chunk_metrics(navs, self.start_date_str, self.end_date_str, self.risk_free_rate)
+            self._jobs.append((navs.codes, result, None))
+            return
+
+        # 紧凑容器写入共享内存，计算进程按名称挂载后构建矩阵并计算
+        _, n_points, size = navs.layout()
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        navs.write_into(shm.buf)
+        future = self._executor.submit(_shared_chunk_metrics, shm.name, navs.codes, n_points,
+                                       self.start_date_str, self.end_date_str, self.risk_free_rate)
+        self._jobs.append((navs.codes, future, shm))
+
+    def _collect(self, wait):
+        """
+        按提交顺序取回已完成批次的结果，并交给 on_chunk 回调
+        :param wait: 为 True 时等待所有批次完成，否则遇到未完成的批次即返回
+        """
+        while self._jobs:
+            codes, result, shm = self._jobs[0]
+            if shm is not None:
+                if not wait and not result.done():
+                    return
+                # 计算出错时该批次留在任务列表中，由 close 释放共享内存
+                result = result.result()
+                shm.close()
+                shm.unlink()
+            self._jobs.pop(0)
+            metrics, aligned = result
+            frame = batch_metrics.metrics_frame(codes, metrics)
+            self._frames.append(frame)
+            self._aligned_dates.append(aligned.dropna().values)
+            if self.on_chunk is not None:
+                self.on_chunk(codes, frame)
+
+    def results(self):
+        """
+        提交剩余的基金并等待所有批次完成
+        :return: DataFrame，每只有效基金一行：基金代码、年化收益率(%)、Ulcer指数(%)、Martin Ratio、最大回撤(%)
+        """
+        if self._pending:
+            self._submit()
+        self._collect(wait=True)
+
+        # 各批次对齐结果中当天或之前最近的交易日，即所有基金交易日历上的对齐结果
+        if self._aligned_dates:
+            calendar = trading_calendar.build_calendar(self._aligned_dates)
+            batch_metrics.report_alignment(calendar, self.start_date_str, self.end_date_str)
+        if not self._frames:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        return pd.concat(self._frames, ignore_index=True)
+
+    def close(self):
+        """关闭进程池，释放尚未取回结果的共享内存"""
+        for _, job, shm in self._jobs:
+            if shm is not None:
+                job.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        for _, _, shm in self._jobs:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self._jobs = []
@@ -0,0 +1,163 @@
+"""
+自适应并发控制（AIMD）
+
+功能概述：
+- 每个接口一个并发控制器，根据观测到的延迟和错误率自动调整允许的并发数
+- 加性增：最近一批请求的p95延迟和错误率都正常时，并发上限加1
+- 乘性减：请求失败或超时、或最近一批请求不健康时，并发上限立即减半
+- 控制器在进程内持续存在，多次批量请求之间保留学习到的并发数
+- 可随时输出各接口的控制器状态到运行日志
+
+使用方式（在事件循环中）：
+controller = controller_for("fund_open_fund_info_em")
+await controller.acquire()
+try:
+    ... 发送请求 ...
+finally:
+    controller.release(latency, ok)
+"""
+
+import asyncio
+from collections import deque
+
+import numpy as np
+
+
+class AimdController:
+    """单个接口的AIMD并发控制器"""
+
+    def __init__(self, name, initial_limit=4, min_limit=1, max_limit=32,
+                 target_p95=2.0, max_error_rate=0.05, window=20, backoff=0.5):
+        """
+        :param name: 接口名称
+        :param initial_limit: 初始并发数
+        :param min_limit: 最小并发数
+        :param max_limit: 最大并发数
+        :param target_p95: 健康的p95延迟上限（秒）
+        :param max_error_rate: 健康的错误率上限
+        :param window: 每统计多少次请求评估一次
+        :param backoff: 乘性减的系数
+        """
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_p95 = target_p95
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._since_adjust = 0
+        self._last_decrease = -max_limit
+        self._waiters = deque()
+        self.total = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        """等待直到当前并发数低于上限，然后占用一个名额"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+        self.in_flight += 1
+
+    def release(self, latency, ok):
+        """
+        释放名额并记录本次请求结果
+        :param latency: 请求耗时（秒）
+        :param ok: 请求是否成功
+        """
+        self.in_flight -= 1
+        self._record(latency, ok)
+        self._wake_waiters()
+
+    def _record(self, latency, ok):
+        self.total += 1
+        self._latencies.append(latency)
+        self._outcomes.append(ok)
+        self._since_adjust += 1
+
+        if not ok:
+            self.errors += 1
+            # 失败或超时立即减半；减半时已在进行中的请求随后失败不再重复减半
+            if self.total - self._last_decrease >= self.limit:
+                self._decrease()
+            return
+
+        if self._since_adjust >= self.window:
+            if self.p95() <= self.target_p95 and self.error_rate() <= self.max_error_rate:
+                self._increase()
+            else:
+                self._decrease()
+
+    def _increase(self):
+        if self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.increases += 1
+        self._since_adjust = 0
+
+    def _decrease(self):
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.decreases += 1
+        self._last_decrease = self.total
+        self._since_adjust = 0
+
+    def _wake_waiters(self):
+        available = int(self.limit) - self.in_flight
+        while available > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                available -= 1
+
+    def p95(self):
+        """最近一批请求的p95延迟（秒）"""
+        if not self._latencies:
+            return 0.0
+        return float(np.percentile(self._latencies, 95))
+
+    def error_rate(self):
+        """最近一批请求的错误率"""
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def state(self):
+        """当前状态，用于运行日志"""
+        return {
+            "接口": self.name,
+            "并发上限": round(self.limit, 2),
+            "进行中": self.in_flight,
+            "p95延迟(秒)": round(self.p95(), 3),
+            "错误率": round(self.error_rate(), 3),
+            "请求总数": self.total,
+            "失败总数": self.errors,
+            "增加次数": self.increases,
+            "减半次数": self.decreases,
+        }
+
+
+_controllers = {}
+
+
+def controller_for(name, **kwargs):
+    """返回接口对应的控制器（首次使用时创建，kwargs 只在创建时生效）"""
+    if name not in _controllers:
+        _controllers[name] = AimdController(name, **kwargs)
+    return _controllers[name]
+
+
+def log_states():
+    """把各接口控制器的状态输出到运行日志"""
+    for controller in _controllers.values():
+        state = controller.state()
+        print("并发控制：" + "，".join(f"{k}={v}" for k, v in state.items()))
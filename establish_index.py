@@ -0,0 +1,101 @@
+"""
+基金成立日期本地索引
+
+功能概述：
+- 在本地持久保存"基金代码 -> 成立日期"的索引，基金的成立时间不会变化，只需获取一次
+- 按需补全：只对索引中缺少的基金调用fund_individual_basic_info_xq接口
+- 成立年限判断对整个索引做向量化比较，不再逐只基金请求
+
+索引文件：
+- establish_index.parquet：基金代码、成立时间两列
+"""
+
+import os
+from datetime import datetime
+
+import akshare as ak
+import pandas as pd
+
+import rate_limit
+
+# 索引文件路径，放在脚本同级目录下
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "establish_index.parquet")
+
+
+def load_index():
+    """
+    读取本地成立日期索引
+    :return: 以基金代码为索引、成立时间（datetime64）为值的Series；本地没有索引时返回空Series
+    """
+    if not os.path.exists(INDEX_PATH):
+        return pd.Series(dtype="datetime64[ns]", name="成立时间").rename_axis("基金代码")
+    index_df = pd.read_parquet(INDEX_PATH)
+    return index_df.set_index("基金代码")["成立时间"]
+
+
+def save_index(index):
+    """保存成立日期索引，先写临时文件再替换"""
+    index_df = index.rename("成立时间").rename_axis("基金代码").reset_index()
+    tmp_path = f"{INDEX_PATH}.{os.getpid()}.tmp"
+    index_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def fetch_establish_date(fund_code):
+    """
+    从接口获取单只基金的成立日期
+    :param fund_code: 6位基金代码
+    :return: 成立日期（datetime）
+    """
+    # 官网指定接口：获取基金基本信息（含成立时间）
+    # 文档地址：https://akshare.akfamily.xyz/data/fund/fund_public.html#fund-individual-basic-info-xq
+    rate_limit.acquire_for_endpoint("fund_individual_basic_info_xq")
+    fund_info = ak.fund_individual_basic_info_xq(symbol=fund_code)
+    return parse_establish_date(fund_info)
+
+
+def parse_establish_date(fund_info):
+    """
+    从基金基本信息中解析成立日期
+    :param fund_info: fund_individual_basic_info_xq 格式的DataFrame（item、value两列）
+    :return: 成立日期（datetime）
+    """
+    # 提取成立时间（官网返回格式为DataFrame，项目列含"成立时间"）
+    establish_row = fund_info[fund_info['item'] == '成立时间']
+    if establish_row.empty:
+        raise ValueError("未找到'成立时间'字段")
+
+    # 解析日期（官网示例格式：2015-01-01）
+    return datetime.strptime(establish_row['value'].values[0], '%Y-%m-%d')
+
+
+def missing_codes(index, fund_codes):
+    """返回不在索引中的基金代码（保持原有顺序）"""
+    fund_codes = pd.Index(fund_codes)
+    return fund_codes[~fund_codes.isin(index.index)].tolist()
+
+
+def add_dates(index, new_dates):
+    """
+    把新获取的成立日期合并进索引
+    :param index: 现有索引
+    :param new_dates: {基金代码: 成立日期} 字典
+    :return: 合并后的索引
+    """
+    if not new_dates:
+        return index
+    new_index = pd.Series(pd.to_datetime(list(new_dates.values())), index=list(new_dates.keys()), name="成立时间")
+    new_index = new_index.rename_axis("基金代码")
+    return pd.concat([index[~index.index.isin(new_index.index)], new_index])
+
+
+def established_before(index, fund_codes, threshold):
+    """
+    向量化判断基金成立日期是否不晚于阈值
+    :param index: 成立日期索引
+    :param fund_codes: 待判断的基金代码
+    :param threshold: 日期阈值
+    :return: 与 fund_codes 对齐的布尔数组；索引中没有的基金为 False
+    """
+    dates = index.reindex(pd.Index(fund_codes))
+    return (dates <= pd.Timestamp(threshold)).to_numpy()
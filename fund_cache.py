@@ -0,0 +1,151 @@
+"""
+akshare接口响应缓存
+
+功能概述：
+- 为流水线中调用的akshare接口提供本地磁盘缓存
+- 以"接口名称+调用参数"作为缓存键，重复运行时直接读取本地结果
+- 按接口分别设置过期策略，过期后自动重新请求
+
+过期策略：
+1. 基金列表、申购状态（fund_name_em、fund_purchase_em）：当日有效，次日零点过期
+2. 基金基本信息（fund_individual_basic_info_xq）：365天过期，成立时间等信息几乎不会变化
+3. 净值走势、阶段业绩（fund_open_fund_info_em、fund_individual_achievement_xq）：
+   到下一个收盘时间（交易日15:00）过期
+
+缓存文件：
+- .fund_cache/<接口名称>/<参数哈希>.pkl：保存过期时间和接口返回的DataFrame
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from datetime import datetime, timedelta
+
+import rate_limit
+import single_flight
+
+# 缓存根目录，放在脚本同级目录下，便于在不同工作目录运行时共用
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fund_cache")
+
+# 收盘时间（小时）
+MARKET_CLOSE_HOUR = 15
+
+# 各接口的过期策略："daily" 次日零点过期，"market_close" 下一个收盘时间过期，timedelta 固定有效期
+ENDPOINT_TTL = {
+    "fund_name_em": "daily",
+    "fund_purchase_em": "daily",
+    "fund_individual_basic_info_xq": timedelta(days=365),
+    "fund_open_fund_info_em": "market_close",
+    "fund_individual_achievement_xq": "market_close",
+}
+
+# 不参与缓存键计算的参数（只影响请求方式，不影响返回内容）
+IGNORED_KWARGS = {"timeout"}
+
+# 缓存未命中时，相同请求只发出一次
+_flight = single_flight.SingleFlight()
+
+
+def last_market_close(now=None):
+    """返回不晚于 now 的最近一个收盘时间（周一至周五15:00）"""
+    now = now or datetime.now()
+    close = now.replace(hour=MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+    if close > now:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:
+        close -= timedelta(days=1)
+    return close
+
+
+def next_market_close(now=None):
+    """返回晚于 now 的下一个收盘时间（周一至周五15:00）"""
+    now = now or datetime.now()
+    close = now.replace(hour=MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+    if close <= now:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close
+
+
+def expires_at(endpoint, fetched_at):
+    """根据接口的过期策略计算缓存过期时间"""
+    ttl = ENDPOINT_TTL[endpoint]
+    if ttl == "daily":
+        return datetime.combine(fetched_at.date() + timedelta(days=1), datetime.min.time())
+    if ttl == "market_close":
+        return next_market_close(fetched_at)
+    return fetched_at + ttl
+
+
+def cache_key(endpoint, kwargs):
+    """由接口名称和调用参数生成缓存键"""
+    params = {k: v for k, v in kwargs.items() if k not in IGNORED_KWARGS}
+    raw = json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_path(endpoint, kwargs):
+    return os.path.join(CACHE_DIR, endpoint, cache_key(endpoint, kwargs) + ".pkl")
+
+
+def load(endpoint, kwargs, allow_expired=False):
+    """
+    读取未过期的缓存
+    :param endpoint: akshare接口名称
+    :param kwargs: 调用参数
+    :param allow_expired: 为 True 时也返回已过期的缓存（离线分析时使用）
+    :return: 缓存的返回值；不存在、已过期或文件损坏时返回 None
+    """
+    path = _cache_path(endpoint, kwargs)
+    try:
+        with open(path, "rb") as f:
+            entry = pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError):
+        return None
+    if entry["expires_at"] <= datetime.now() and not allow_expired:
+        return None
+    return entry["data"]
+
+
+def store(endpoint, kwargs, data):
+    """写入缓存，先写临时文件再替换，避免中断时留下半个文件"""
+    path = _cache_path(endpoint, kwargs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fetched_at = datetime.now()
+    entry = {
+        "fetched_at": fetched_at,
+        "expires_at": expires_at(endpoint, fetched_at),
+        "data": data,
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def cached_call(func, **kwargs):
+    """
+    带缓存地调用akshare接口
+    :param func: akshare接口函数，例如 ak.fund_name_em
+    :param kwargs: 传给接口的关键字参数
+    :return: 接口返回值（命中缓存时为本地副本）
+    """
+    endpoint = func.__name__
+    if endpoint not in ENDPOINT_TTL:
+        return func(**kwargs)
+
+    data = load(endpoint, kwargs)
+    if data is not None:
+        return data
+
+    def fetch():
+        rate_limit.acquire_for_endpoint(endpoint)
+        result = func(**kwargs)
+        if result is not None:
+            store(endpoint, kwargs, result)
+        return result
+
+    # 其他线程正在请求相同接口和参数时，等待并共用那次请求的结果
+    return _flight.do(cache_key(endpoint, kwargs), fetch)
@@ -0,0 +1,261 @@
+"""
+基金累计净值本地存储
+
+功能概述：
+- 在本地按基金代码保存累计净值序列，每只基金一个Parquet列式文件
+- 只追加新交易日的净值，已保存的历史数据不会被改写或重复下载
+- 本地已有最近一个应公布净值的交易日（NAV_PUBLISH_HOUR 点之后为当天，否则为前一个交易日）的净值时直接读取，不访问网络
+
+处理流程：
+1. 读取本地已保存的净值序列
+2. 本地没有数据时，使用fund_open_fund_info_em接口下载完整历史
+3. 本地已有数据时，使用天天基金历史净值接口只请求最后保存日期之后的净值
+4. 增量接口失败时退回完整下载，并只保留最后保存日期之后的行
+5. 合并新旧数据后写回本地文件
+6. 批量更新（refresh_many）时，需要访问网络的基金通过异步引擎在一个事件循环内并发请求；
+   基金代码按需取出，最多同时处理 async_fetch.MAX_IN_FLIGHT 只，处理完的净值逐只交给回调
+
+存储文件：
+- nav_store/<基金代码>.parquet：净值日期、累计净值两列，按日期升序
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import akshare as ak
+import pandas as pd
+import requests
+
+import concurrency
+import rate_limit
+import single_flight
+from async_fetch import AsyncFetcher, bounded_map
+
+# 净值文件目录，放在脚本同级目录下
+NAV_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nav_store")
+
+# 天天基金历史净值接口，支持按起止日期分页查询
+LSJZ_URL = "https://api.fund.eastmoney.com/f10/lsjz"
+LSJZ_PAGE_SIZE = 20
+LSJZ_HEADERS = {
+    "Referer": "https://fundf10.eastmoney.com/",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/80.0.3987.149 Safari/537.36",
+}
+
+NAV_COLUMNS = ["净值日期", "累计净值"]
+
+# 基金净值一般在交易日晚间公布，这个时间之后才认为当天的净值应该已经公布
+NAV_PUBLISH_HOUR = 20
+
+# 同一只基金的同步更新只进行一次
+_flight = single_flight.SingleFlight()
+
+
+def _nav_path(fund_code):
+    return os.path.join(NAV_DIR, f"{str(fund_code).zfill(6)}.parquet")
+
+
+def _normalize(nav_df):
+    """统一列类型：净值日期为datetime64，累计净值为float，去重并按日期升序"""
+    nav_df = nav_df[NAV_COLUMNS].copy()
+    nav_df["净值日期"] = pd.to_datetime(nav_df["净值日期"], errors="coerce")
+    nav_df["累计净值"] = pd.to_numeric(nav_df["累计净值"], errors="coerce")
+    nav_df = nav_df.dropna(subset=["净值日期"])
+    nav_df = nav_df.drop_duplicates(subset="净值日期", keep="last")
+    return nav_df.sort_values("净值日期").reset_index(drop=True)
+
+
+def _write_nav(fund_code, nav_df):
+    """先写临时文件再替换，避免中断时损坏已保存的数据"""
+    os.makedirs(NAV_DIR, exist_ok=True)
+    path = _nav_path(fund_code)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    nav_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def read_nav(fund_code):
+    """
+    读取本地保存的累计净值
+    :param fund_code: 基金代码
+    :return: 含净值日期、累计净值两列的DataFrame；本地没有数据时返回 None
+    """
+    path = _nav_path(fund_code)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def expected_nav_date(now=None):
+    """
+    最近一个净值应已公布的交易日（周一至周五，当天 NAV_PUBLISH_HOUR 点之后才计入当天）
+    :return: 日期（Timestamp，不含时间）
+    """
+    now = now or datetime.now()
+    day = now.date() if now.hour >= NAV_PUBLISH_HOUR else now.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return pd.Timestamp(day)
+
+
+def is_fresh(stored, now=None):
+    """
+    本地净值已包含最近一个应公布净值的交易日时视为最新
+    节假日或净值延迟公布时该日期没有净值，每次运行都会再发出一次增量请求，直到取到之后的净值
+    :param stored: 本地净值DataFrame，可以为 None
+    """
+    if stored is None or stored.empty:
+        return False
+    return stored["净值日期"].iloc[-1] >= expected_nav_date(now)
+
+
+def _fetch_full(fund_code):
+    """下载完整的累计净值历史"""
+    rate_limit.acquire_for_endpoint("fund_open_fund_info_em")
+    nav_df = ak.fund_open_fund_info_em(symbol=str(fund_code).zfill(6), indicator="累计净值走势")
+    if nav_df is None or nav_df.empty:
+        return pd.DataFrame(columns=NAV_COLUMNS)
+    return _normalize(nav_df)
+
+
+def _fetch_since(fund_code, start_date):
+    """只请求 start_date（含）之后的累计净值，按页读取直到取完"""
+    rows = []
+    page = 1
+    while True:
+        params = {
+            "fundCode": str(fund_code).zfill(6),
+            "pageIndex": page,
+            "pageSize": LSJZ_PAGE_SIZE,
+            "startDate": start_date.strftime("%Y-%m-%d"),
+            "endDate": "",
+        }
+        rate_limit.limiter_for("api.fund.eastmoney.com").acquire()
+        r = requests.get(LSJZ_URL, params=params, headers=LSJZ_HEADERS, timeout=10)
+        data_json = r.json()
+        page_rows = data_json["Data"]["LSJZList"] or []
+        rows.extend(page_rows)
+        if len(rows) >= data_json["TotalCount"] or not page_rows:
+            break
+        page += 1
+
+    nav_df = pd.DataFrame(rows, columns=["FSRQ", "LJJZ"])
+    nav_df.columns = NAV_COLUMNS
+    return _normalize(nav_df)
+
+
+def update_nav(fund_code):
+    """
+    更新并返回一只基金的累计净值序列；多个线程同时更新同一只基金时只请求一次，也不会同时写同一个文件
+    :param fund_code: 基金代码
+    :return: 含净值日期、累计净值两列的DataFrame，按日期升序
+    """
+    return _flight.do(str(fund_code).zfill(6), lambda: _update_nav(fund_code))
+
+
+def _update_nav(fund_code):
+    stored = read_nav(fund_code)
+    if is_fresh(stored):
+        return stored
+
+    if stored is None or stored.empty:
+        nav_df = _fetch_full(fund_code)
+        _write_nav(fund_code, nav_df)
+        return nav_df
+
+    last_date = stored["净值日期"].iloc[-1]
+    try:
+        new_rows = _fetch_since(fund_code, last_date + timedelta(days=1))
+    except Exception as e:
+        print(f"基金 {fund_code} 增量获取净值失败（{e}），改为完整下载")
+        new_rows = _fetch_full(fund_code)
+    return _append_rows(fund_code, stored, new_rows)
+
+
+def _append_rows(fund_code, stored, new_rows):
+    """把最后保存日期之后的新行追加到本地序列并写回"""
+    last_date = stored["净值日期"].iloc[-1]
+    new_rows = new_rows[new_rows["净值日期"] > last_date]
+
+    if new_rows.empty:
+        return stored
+
+    nav_df = pd.concat([stored, new_rows], ignore_index=True)
+    _write_nav(fund_code, nav_df)
+    return nav_df
+
+
+async def _update_async(fetcher, fund_code, stored):
+    """update_nav 的异步版本，通过 AsyncFetcher 请求数据"""
+    if stored is None or stored.empty:
+        nav_df = _normalize(await fetcher.fund_open_fund_info_em(fund_code))
+        _write_nav(fund_code, nav_df)
+        return nav_df
+
+    last_date = stored["净值日期"].iloc[-1]
+    try:
+        new_rows = _normalize(await fetcher.fund_nav_since(fund_code, last_date + timedelta(days=1)))
+    except Exception as e:
+        print(f"基金 {fund_code} 增量获取净值失败（{e}），改为完整下载")
+        new_rows = _normalize(await fetcher.fund_open_fund_info_em(fund_code))
+    return _append_rows(fund_code, stored, new_rows)
+
+
+async def refresh_async(fetcher, fund_code):
+    """
+    更新一只基金的净值（本地净值已是最新的基金不访问网络），出错时输出信息并返回 None
+    :param fetcher: 已进入 async with 的 AsyncFetcher
+    :param fund_code: 6位基金代码
+    :return: (净值DataFrame或None, 是否访问了网络)
+    """
+    stored = read_nav(fund_code)
+    if is_fresh(stored):
+        return stored, False
+    try:
+        return await _update_async(fetcher, fund_code, stored), True
+    except Exception as e:
+        print(f"获取基金 {fund_code} 数据时出错: {str(e)}")
+        return None, True
+
+
+async def iter_refresh(fetcher, fund_codes):
+    """
+    逐只更新基金净值，按完成顺序交出结果
+    :param fetcher: 已进入 async with 的 AsyncFetcher
+    :param fund_codes: 6位基金代码的可迭代对象（可以是生成器）
+    :return: 异步生成器，依次产生 (基金代码, 净值DataFrame或None, 是否访问了网络)
+    """
+    async def refresh_one(fund_code):
+        return await refresh_async(fetcher, fund_code)
+
+    async for fund_code, (nav_df, fetched) in bounded_map(refresh_one, fund_codes):
+        yield fund_code, nav_df, fetched
+
+
+def refresh_many(fund_codes, on_result=None, keep=True):
+    """
+    批量更新多只基金的累计净值，需要访问网络的基金在一个事件循环内并发请求
+    :param fund_codes: 6位基金代码的可迭代对象（可以是生成器，按需取出）
+    :param on_result: 每只基金处理完成时的回调 on_result(基金代码, 净值DataFrame或None)
+    :param keep: 为 False 时返回的字典中不保留净值（值为 None），净值只交给 on_result 处理，节省内存
+    :return: {基金代码: 净值DataFrame}，获取失败的基金不在结果中
+    """
+    navs = {}
+    counts = {False: 0, True: 0}
+
+    async def main():
+        async with AsyncFetcher() as fetcher:
+            async for fund_code, nav_df, fetched in iter_refresh(fetcher, fund_codes):
+                counts[fetched] += 1
+                if nav_df is not None:
+                    navs[fund_code] = nav_df if keep else None
+                if on_result is not None:
+                    on_result(fund_code, nav_df)
+
+    asyncio.run(main())
+    print(f"本地净值已是最新：{counts[False]} 只，访问网络更新：{counts[True]} 只")
+    if counts[True]:
+        concurrency.log_states()
+    return navs
@@ -0,0 +1,428 @@
+"""
+Ulcer指数和Martin比率的增量（流式）计算
+
+功能概述：
+- 为每只基金在本地保存累加器状态，每天只用新增的净值更新，不再对整个区间重新计算
+- 累计区间（UlcerAccumulator）：从固定的起始日期到最新净值，状态为期初净值、累计峰值、
+  回撤平方和、净值点数，每个新净值点只需几次算术运算
+- 滑动窗口（SlidingUlcer）：最近 N 年的固定长度窗口，窗口起点随最新日期前移时移出过期的净值，
+  每个新净值点均摊 O(log n) 次运算（n 为窗口内净值点数），结果与 rolling_metrics.py 的最后一个窗口相同
+- 净值通过 nav_store.refresh_many 批量更新后直接交给累加器，状态文件保存在 online_state 文件夹中
+
+滑动窗口算法说明：
+- 窗口内的回撤以窗口起点之后的累计峰值为基准，起点移出时之后各点的峰值会变化，不能简单相减
+- 与 rolling_metrics.py 相同，每个净值点指向之后第一个更高净值的位置（峰值链），
+  同一峰值下一段的回撤平方和由净值及其平方的前缀和求出
+- 新净值到来时，用单调栈确定被它超过的净值点，把这些点挂到新点下（带权并查集，权为该段回撤平方和）
+- 窗口的回撤平方和 = 窗口起点沿峰值链到窗口最高点的路径权重和（路径压缩）+ 窗口最高点之后一段的值
+
+存储文件：
+- online_state/cumulative_<起始日期>.parquet：累计区间的累加器状态，每只基金一行
+- online_state/sliding_<N>y.parquet：N 年滑动窗口的累加器状态，每只基金一行
+
+用法：
+python online_metrics.py [基金代码 ...] [--start 2023-02-24 | --window-years 3] [--offline] [--export 每日指标.xlsx]
+"""
+
+import argparse
+import math
+import os
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import nav_store
+import stage_io
+import trading_calendar
+from run_pipeline import load_stage
+
+# 状态文件目录，放在脚本同级目录下
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "online_state")
+
+RESULT_COLUMNS = ['基金代码', '起始日期', '最新日期', '新增净值点数', '年化收益率(%)', 'Ulcer指数(%)', 'Martin Ratio']
+
+
+def _new_rows(fund_data, last_date):
+    """按日期升序取出 last_date 之后的有效净值，返回 (日期数组, 净值数组)"""
+    fund_data = fund_data.dropna(subset=['累计净值']).sort_values('净值日期')
+    dates = fund_data['净值日期'].to_numpy(dtype='datetime64[ns]')
+    values = fund_data['累计净值'].to_numpy(dtype=np.float64)
+    if last_date is not None:
+        begin = np.searchsorted(dates, np.datetime64(last_date, 'ns'), side='right')
+        dates, values = dates[begin:], values[begin:]
+    return dates, values
+
+
+class UlcerAccumulator:
+    """从固定起始日期开始的累计区间累加器"""
+
+    def __init__(self, start_date_str):
+        """
+        :param start_date_str: 区间起始日期，期初净值为该日期当天或之前最近的净值
+        """
+        self.start_date = pd.Timestamp(start_date_str)
+        self.first_date = None
+        self.first_value = None
+        self.last_date = None
+        self.last_value = None
+        self.peak = None
+        self.sum_sq = 0.0
+        self.count = 0
+
+    def update(self, date, value):
+        """加入一个新净值点（日期须晚于已加入的净值）"""
+        if self.count == 0:
+            self.first_date, self.first_value, self.peak = pd.Timestamp(date), value, value
+        if value > self.peak:
+            self.peak = value
+        drawdown = (self.peak - value) / self.peak
+        self.sum_sq += drawdown * drawdown
+        self.count += 1
+        self.last_date, self.last_value = pd.Timestamp(date), value
+
+    def extend(self, fund_data):
+        """
+        加入净值序列中尚未加入的净值点
+        :param fund_data: 含净值日期、累计净值两列的DataFrame
+        :return: 新加入的净值点数；起始日期当天或之前没有净值（或间隔超过 MAX_GAP_DAYS 天）时为 0
+        """
+        dates, values = _new_rows(fund_data, self.last_date)
+        if self.count == 0 and len(dates):
+            # 与第3步相同：期初为起始日期当天或之前最近的净值
+            start_pos = trading_calendar.prior_positions(dates, [self.start_date])[0]
+            max_gap = np.timedelta64(trading_calendar.MAX_GAP_DAYS, 'D')
+            if start_pos < 0 or dates[start_pos] < np.datetime64(self.start_date, 'ns') - max_gap:
+                return 0
+            dates, values = dates[start_pos:], values[start_pos:]
+        for date, value in zip(dates, values.tolist()):
+            self.update(date, value)
+        return len(dates)
+
+    def metrics(self, risk_free_rate):
+        """
+        :return: (年化收益率%, Ulcer指数%, Martin比率)；没有净值时为 None
+        """
+        if self.count == 0:
+            return None
+        # 与第3步相同：年限按请求的起始日期到最新净值日期计算
+        years = (self.last_date - self.start_date).days / 365
+        annualized_return = ((self.last_value / self.first_value) ** (1 / years) - 1) * 100 if years > 0 else np.nan
+        ulcer_index = math.sqrt(self.sum_sq / self.count) * 100
+        martin_ratio = (annualized_return - risk_free_rate) / ulcer_index if ulcer_index > 0 else np.nan
+        return annualized_return, ulcer_index, martin_ratio
+
+    def to_record(self):
+        return {
+            '起始日期': self.start_date,
+            '期初日期': self.first_date,
+            '期初净值': self.first_value,
+            '最新日期': self.last_date,
+            '最新净值': self.last_value,
+            '峰值': self.peak,
+            '回撤平方和': self.sum_sq,
+            '净值点数': self.count,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        state = cls(record['起始日期'])
+        if record['净值点数']:
+            state.first_date = pd.Timestamp(record['期初日期'])
+            state.first_value = record['期初净值']
+            state.last_date = pd.Timestamp(record['最新日期'])
+            state.last_value = record['最新净值']
+            state.peak = record['峰值']
+            state.sum_sq = record['回撤平方和']
+            state.count = int(record['净值点数'])
+        return state
+
+
+class SlidingUlcer:
+    """最近 N 年固定长度窗口的累加器"""
+
+    def __init__(self, years=3):
+        """
+        :param years: 窗口长度（年），窗口起点为最新日期往前推 years 年后的第一个交易日
+        """
+        self.years = years
+        self.first_date = None
+        self.base = None
+        # 各列表第0项的序号；窗口起点的序号
+        self.offset = 0
+        self.start = 0
+        self.dates = []
+        self.values = []
+        # 各净值点之前（不含）平移后净值及其平方的前缀和
+        self.before1 = []
+        self.before2 = []
+        # 带权并查集：父节点序号（根节点指向自身）和到父节点的回撤平方和
+        self.parent = []
+        self.weight = []
+        # 尚未出现更高净值的点（单调栈，净值非增），栈底为窗口最高点
+        self.stack = deque()
+        self.total1 = 0.0
+        self.total2 = 0.0
+        self._complete = False
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def _segment(self, peak, count):
+        """同一峰值下，从 peak 开始 count 个净值点（直到目前最新的前缀和为止）的回撤平方和"""
+        i = peak - self.offset
+        base = self.values[i] - self.base
+        total = self.total1 - self.before1[i]
+        total_sq = self.total2 - self.before2[i]
+        return (count * base ** 2 - 2 * base * total + total_sq) / self.values[i] ** 2
+
+    def _distance(self, node):
+        """node 沿峰值链到根节点（窗口最高点）的回撤平方和，同时压缩路径"""
+        path = []
+        while self.parent[node - self.offset] != node:
+            path.append(node)
+            node = self.parent[node - self.offset]
+        root = node
+        # 从靠近根节点的一端开始，使父节点的权重已是到根节点的距离
+        for node in reversed(path):
+            i = node - self.offset
+            parent = self.parent[i]
+            if parent != root:
+                self.weight[i] += self.weight[parent - self.offset]
+                self.parent[i] = root
+        return self.weight[path[0] - self.offset] if path else 0.0
+
+    def update(self, date, value, window_begin=None):
+        """
+        加入一个新净值点（日期须晚于已加入的净值），并移出窗口之外的净值点
+        :param window_begin: 该点所在窗口的起始日期，默认由 date 往前推 years 年
+        """
+        date = np.datetime64(date, 'ns')
+        if window_begin is None:
+            window_begin = np.datetime64(pd.Timestamp(date) - pd.DateOffset(years=self.years), 'ns')
+        if self.first_date is None:
+            self.first_date = date
+        if self.base is None:
+            # 以首个净值为基准平移后做前缀和，减小大数相减带来的舍入误差
+            self.base = value
+        node = self.offset + len(self.values)
+
+        # 被新净值超过的点：该点的峰值段到此结束，挂到新点下
+        while self.stack and self.values[self.stack[-1] - self.offset] < value:
+            peak = self.stack.pop()
+            self.weight[peak - self.offset] = self._segment(peak, node - peak)
+            self.parent[peak - self.offset] = node
+
+        self.dates.append(date)
+        self.values.append(value)
+        self.before1.append(self.total1)
+        self.before2.append(self.total2)
+        self.parent.append(node)
+        self.weight.append(0.0)
+        self.stack.append(node)
+        shifted = value - self.base
+        self.total1 += shifted
+        self.total2 += shifted * shifted
+
+        # 窗口起点前移：只有之后的点指向之前的点，过期的点可以直接丢弃
+        while self.dates[self.start - self.offset] < window_begin:
+            self.start += 1
+        while self.stack[0] < self.start:
+            self.stack.popleft()
+        if self.start - self.offset > len(self.values) // 2:
+            self._trim()
+
+    def _trim(self):
+        """删除窗口起点之前的净值点"""
+        cut = self.start - self.offset
+        for name in ('dates', 'values', 'before1', 'before2', 'parent', 'weight'):
+            setattr(self, name, getattr(self, name)[cut:])
+        self.offset = self.start
+
+    def extend(self, fund_data):
+        """
+        加入净值序列中尚未加入的净值点
+        :param fund_data: 含净值日期、累计净值两列的DataFrame
+        :return: 新加入的净值点数
+        """
+        dates, values = _new_rows(fund_data, self.last_date)
+        if not len(dates):
+            return 0
+        if self.first_date is None:
+            # 首次加入时，最新日期所在窗口之前的净值会立即过期，只从窗口起点当天或之前最近的净值开始
+            self.first_date = dates[0]
+            window_begin = np.datetime64(pd.Timestamp(dates[-1]) - pd.DateOffset(years=self.years), 'ns')
+            begin = max(trading_calendar.prior_positions(dates, [window_begin])[0], 0)
+            dates, values = dates[begin:], values[begin:]
+        window_begins = (pd.DatetimeIndex(dates) - pd.DateOffset(years=self.years)).to_numpy()
+        for date, value, window_begin in zip(dates, values.tolist(), window_begins):
+            self.update(date, value, window_begin)
+        return len(dates)
+
+    def window_complete(self):
+        """净值历史是否覆盖一个完整窗口"""
+        # 窗口一旦完整，之后的窗口都完整，不再重复计算日期
+        if not self._complete and self.dates:
+            window_begin = pd.Timestamp(self.dates[-1]) - pd.DateOffset(years=self.years)
+            self._complete = window_begin >= pd.Timestamp(self.first_date)
+        return self._complete
+
+    def metrics(self, risk_free_rate):
+        """
+        :return: (年化收益率%, Ulcer指数%, Martin比率)；净值历史不足一个完整窗口时为 None
+        """
+        if not self.window_complete():
+            return None
+        start, end = self.start, self.offset + len(self.values) - 1
+        sum_sq = self._distance(start) + self._segment(self.stack[0], end - self.stack[0] + 1)
+        # 与 rolling_metrics.py 相同：年限按窗口起止日期的自然日数/365计算
+        years = (self.dates[-1] - self.dates[start - self.offset]) / np.timedelta64(1, 'D') / 365
+        ratio = self.values[-1] / self.values[start - self.offset]
+        annualized_return = (ratio ** (1 / years) - 1) * 100 if years > 0 else np.nan
+        ulcer_index = math.sqrt(max(sum_sq, 0.0) / (end - start + 1)) * 100
+        martin_ratio = (annualized_return - risk_free_rate) / ulcer_index if ulcer_index > 0 else np.nan
+        return annualized_return, ulcer_index, martin_ratio
+
+    def window_start_date(self):
+        return self.dates[self.start - self.offset] if self.dates else None
+
+    def to_record(self):
+        self._trim()
+        return {
+            '窗口年数': self.years,
+            '首个日期': pd.Timestamp(self.first_date),
+            '基准净值': self.base,
+            '起点序号': self.offset,
+            '净值日期': np.array(self.dates, dtype='datetime64[ns]').astype(np.int64),
+            '累计净值': np.array(self.values, dtype=np.float64),
+            '前缀和': np.array(self.before1, dtype=np.float64),
+            '平方前缀和': np.array(self.before2, dtype=np.float64),
+            '父节点': np.array(self.parent, dtype=np.int64),
+            '权重': np.array(self.weight, dtype=np.float64),
+            '单调栈': np.array(self.stack, dtype=np.int64),
+            '总和': self.total1,
+            '平方总和': self.total2,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        state = cls(int(record['窗口年数']))
+        if len(record['累计净值']) == 0:
+            return state
+        state.first_date = np.datetime64(record['首个日期'], 'ns')
+        state.base = record['基准净值']
+        state.offset = state.start = int(record['起点序号'])
+        state.dates = list(np.asarray(record['净值日期'], dtype=np.int64).astype('datetime64[ns]'))
+        state.values = np.asarray(record['累计净值'], dtype=np.float64).tolist()
+        state.before1 = np.asarray(record['前缀和'], dtype=np.float64).tolist()
+        state.before2 = np.asarray(record['平方前缀和'], dtype=np.float64).tolist()
+        state.parent = np.asarray(record['父节点'], dtype=np.int64).tolist()
+        state.weight = np.asarray(record['权重'], dtype=np.float64).tolist()
+        state.stack = deque(np.asarray(record['单调栈'], dtype=np.int64).tolist())
+        state.total1 = record['总和']
+        state.total2 = record['平方总和']
+        return state
+
+
+def state_path(start_date_str=None, window_years=None):
+    """状态文件路径：指定 window_years 时为滑动窗口，否则为从 start_date_str 开始的累计区间"""
+    if window_years is not None:
+        return os.path.join(STATE_DIR, f"sliding_{window_years}y.parquet")
+    return os.path.join(STATE_DIR, f"cumulative_{pd.Timestamp(start_date_str):%Y%m%d}.parquet")
+
+
+def load_states(path, state_cls):
+    """
+    读取累加器状态
+    :param state_cls: UlcerAccumulator 或 SlidingUlcer
+    :return: {基金代码: UlcerAccumulator 或 SlidingUlcer}；没有状态文件时返回空字典
+    """
+    if not os.path.exists(path):
+        return {}
+    state_df = pd.read_parquet(path)
+    return {record.pop('基金代码'): state_cls.from_record(record) for record in state_df.to_dict('records')}
+
+
+def save_states(path, states):
+    """保存累加器状态，先写临时文件再替换"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    state_df = pd.DataFrame([{'基金代码': code, **state.to_record()} for code, state in states.items()])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    state_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def update_states(fund_codes, start_date_str=None, window_years=None, risk_free_rate=1.5, offline=False):
+    """
+    用新增净值更新各基金的累加器并保存状态
+    :param fund_codes: 基金代码列表
+    :param start_date_str: 累计区间的起始日期（不指定 window_years 时使用）
+    :param window_years: 滑动窗口长度（年），指定时使用滑动窗口
+    :param risk_free_rate: 无风险利率（%）
+    :param offline: 为 True 时只读取本地已保存的净值，不访问网络
+    :return: DataFrame，列见 RESULT_COLUMNS；没有有效结果的基金不输出
+    """
+    path = state_path(start_date_str, window_years)
+    states = load_states(path, SlidingUlcer if window_years is not None else UlcerAccumulator)
+    added = {}
+
+    def on_result(fund_code, fund_data):
+        if fund_data is None or fund_data.empty:
+            return
+        state = states.get(fund_code)
+        if state is None:
+            state = SlidingUlcer(window_years) if window_years is not None else UlcerAccumulator(start_date_str)
+        added[fund_code] = state.extend(fund_data)
+        if state.last_date is not None:
+            states[fund_code] = state
+
+    if offline:
+        for fund_code in fund_codes:
+            on_result(fund_code, nav_store.read_nav(fund_code))
+    else:
+        nav_store.refresh_many(fund_codes, on_result=on_result, keep=False)
+    save_states(path, states)
+    print(f"共更新 {len(added)} 只基金，新增净值 {sum(added.values())} 个")
+
+    rows = []
+    for fund_code in fund_codes:
+        state = states.get(fund_code)
+        metrics = state.metrics(risk_free_rate) if state is not None else None
+        if metrics is None:
+            continue
+        begin = state.window_start_date() if window_years is not None else state.first_date
+        rows.append([fund_code, begin, state.last_date, added.get(fund_code, 0), *metrics])
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def main():
+    stage3 = load_stage("stage3")
+
+    parser = argparse.ArgumentParser(description="用新增净值增量更新Ulcer指数和Martin比率")
+    parser.add_argument("fund_codes", nargs="*", help="6位基金代码，默认为第3步筛选出的基金")
+    parser.add_argument("--start", dest="start_date_str", default=stage3.START_DATE_STR, help="累计区间起始日期")
+    parser.add_argument("--window-years", type=int, help="改用最近 N 年的滑动窗口")
+    parser.add_argument("--risk-free-rate", type=float, default=stage3.RISK_FREE_RATE, help="无风险利率（%%）")
+    parser.add_argument("--offline", action="store_true", help="只使用本地已保存的净值，不访问网络")
+    parser.add_argument("--export", dest="excel_path", help="把结果导出为Excel")
+    args = parser.parse_args()
+
+    if args.fund_codes:
+        fund_codes = [code.zfill(6) for code in args.fund_codes]
+    else:
+        fund_codes = stage_io.read_stage("stage3", columns=["基金代码"])["基金代码"].tolist()
+
+    start_time = time.time()
+    result = update_states(fund_codes, args.start_date_str, args.window_years, args.risk_free_rate, args.offline)
+    print(f"耗时 {time.time() - start_time:.2f} 秒\n")
+    print(result.to_string(index=False))
+
+    if args.excel_path:
+        result.to_excel(args.excel_path, index=False)
+        print(f"结果已导出到：{args.excel_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+筛选参数扫描（离线）
+
+功能概述：
+- 对无风险利率、年化收益率上下限、Martin比率下限、购买起点上限的所有组合重新筛选
+- 只使用本地数据：第1步的基金代码、申购状态缓存（.fund_cache）、本地累计净值（nav_store），不访问网络
+- 各基金的年化收益率和Ulcer指数只计算一次，所有组合的筛选条件按矩阵一次性计算
+- 输出每个组合的入选基金数量和入选基金代码
+
+处理流程：
+1. 读取第1步输出的基金代码、本地申购状态缓存和本地累计净值
+2. 批量计算所有基金在计算区间内的年化收益率和Ulcer指数
+3. 生成参数组合，按 [组合数, 基金数] 的矩阵计算筛选条件
+4. 输出每个组合的入选数量和入选基金，可导出Excel
+
+参数写法：
+- 逗号分隔的取值：1,1.5,2
+- 起止和步长（含终点）：1:3:0.5
+- 未指定的参数使用第2、3步脚本中的当前设置
+
+用法：
+python param_sweep.py --risk-free-rate 1:2.5:0.5 --min-martin 2.5,3,3.5,4 [--export 参数扫描.xlsx]
+"""
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+import batch_metrics
+import compact_nav
+import fund_cache
+import nav_store
+import stage_io
+from run_pipeline import load_stage
+
+# 参数名 -> 结果表中的列名
+SWEEP_COLUMNS = {
+    "risk_free_rate": "无风险利率(%)",
+    "min_return": "年化收益率下限(%)",
+    "max_return": "年化收益率上限(%)",
+    "min_martin": "Martin比率下限",
+    "max_purchase": "购买起点上限(元)",
+}
+
+
+def parse_grid(spec):
+    """
+    解析参数取值
+    :param spec: "1,1.5,2" 或 "1:3:0.5"（含终点）
+    :return: 取值列表
+    """
+    if ":" in spec:
+        start, stop, step = (float(x) for x in spec.split(":"))
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(count)]
+    return [float(x) for x in spec.split(",")]
+
+
+def load_local_data(start_date_str, end_date_str):
+    """
+    读取本地数据并计算各基金的年化收益率和Ulcer指数（不访问网络）
+    :return: DataFrame：基金代码、申购状态、购买起点、年化收益率(%)、Ulcer指数(%)；没有申购状态缓存时返回 None
+    """
+    fund_codes = stage_io.read_stage("stage1", columns=["基金代码"])["基金代码"].tolist()
+    print(f"第1步基金：{len(fund_codes)} 只")
+
+    purchase_data = fund_cache.load("fund_purchase_em", {}, allow_expired=True)
+    if purchase_data is None:
+        print("本地没有申购状态缓存，请先运行第2步")
+        return None
+    purchase_data = purchase_data[["基金代码", "申购状态", "购买起点"]].copy()
+    purchase_data["基金代码"] = purchase_data["基金代码"].astype(str)
+    # 与第2步一致：同一代码有多行时只取第一行
+    purchase_data = purchase_data.drop_duplicates(subset="基金代码")
+    purchase_data["购买起点"] = pd.to_numeric(purchase_data["购买起点"], errors="coerce")
+
+    # 只读取本地已保存的净值
+    navs = {}
+    for fund_code in fund_codes:
+        fund_data = nav_store.read_nav(fund_code)
+        if fund_data is not None:
+            navs[fund_code] = fund_data
+    print(f"本地净值：{len(navs)} 只")
+    navs = compact_nav.CompactNav.from_navs(navs, batch_metrics.window_begin(start_date_str), end_date_str)
+
+    # 无风险利率只影响Martin比率，这里按0计算，扫描时再减去
+    dates, codes, panel = batch_metrics.build_panel(navs, batch_metrics.window_begin(start_date_str), end_date_str)
+    batch_metrics.report_alignment(dates, start_date_str, end_date_str)
+    metrics = batch_metrics.metrics_frame(codes, batch_metrics.panel_metrics(dates, panel, start_date_str,
+                                                                             end_date_str, 0))
+
+    funds = pd.DataFrame({"基金代码": fund_codes})
+    funds = funds.merge(purchase_data, on="基金代码", how="left")
+    return funds.merge(metrics[["基金代码", "年化收益率(%)", "Ulcer指数(%)"]], on="基金代码", how="left")
+
+
+def sweep(funds, grids, excluded_statuses):
+    """
+    对所有参数组合筛选基金
+    :param funds: load_local_data 的结果
+    :param grids: {参数名: 取值列表}，参数名见 SWEEP_COLUMNS
+    :param excluded_statuses: 需要排除的申购状态
+    :return: DataFrame，每个组合一行：各参数、入选数量、入选基金（逗号分隔的基金代码）
+    """
+    names = list(SWEEP_COLUMNS)
+    combos = np.array(list(itertools.product(*(grids[name] for name in names))), dtype=np.float64)
+    rf, min_return, max_return, min_martin, max_purchase = (combos[:, [i]] for i in range(len(names)))
+
+    annualized_return = funds["年化收益率(%)"].to_numpy(dtype=np.float64)[None, :]
+    ulcer_index = funds["Ulcer指数(%)"].to_numpy(dtype=np.float64)[None, :]
+    purchase_start = funds["购买起点"].to_numpy(dtype=np.float64)[None, :]
+    buyable = ~funds["申购状态"].isin(excluded_statuses).to_numpy()[None, :]
+
+    # [组合数, 基金数] 的筛选矩阵；缺失值参与比较时为 False，相当于被筛掉
+    with np.errstate(divide="ignore", invalid="ignore"):
+        martin_ratio = (annualized_return - rf) / ulcer_index
+        selected = (
+            buyable
+            & (purchase_start <= max_purchase)
+            & (annualized_return >= min_return)
+            & (annualized_return <= max_return)
+            & (martin_ratio >= min_martin)
+        )
+
+    codes = funds["基金代码"].to_numpy()
+    result = pd.DataFrame(combos, columns=[SWEEP_COLUMNS[name] for name in names])
+    result["入选数量"] = selected.sum(axis=1)
+    result["入选基金"] = [",".join(codes[row]) for row in selected]
+    return result
+
+
+def main():
+    stage2 = load_stage("stage2")
+    stage3 = load_stage("stage3")
+
+    parser = argparse.ArgumentParser(description="离线扫描筛选参数的所有组合")
+    parser.add_argument("--start", dest="start_date_str", default=stage3.START_DATE_STR, help="计算区间起始日期")
+    parser.add_argument("--end", dest="end_date_str", default=stage3.END_DATE_STR, help="计算区间结束日期")
+    parser.add_argument("--risk-free-rate", default=str(stage3.RISK_FREE_RATE), help="无风险利率（%%）")
+    parser.add_argument("--min-return", default=str(stage3.MIN_ANNUALIZED_RETURN), help="年化收益率下限（%%）")
+    parser.add_argument("--max-return", default=str(stage3.MAX_ANNUALIZED_RETURN), help="年化收益率上限（%%）")
+    parser.add_argument("--min-martin", default=str(stage3.MIN_MARTIN_RATIO), help="Martin比率下限")
+    parser.add_argument("--max-purchase", default=str(stage2.MAX_PURCHASE_START), help="购买起点上限（元）")
+    parser.add_argument("--export", dest="excel_path", help="把扫描结果导出为Excel")
+    args = parser.parse_args()
+
+    grids = {name: parse_grid(getattr(args, name)) for name in SWEEP_COLUMNS}
+
+    start_time = time.time()
+    funds = load_local_data(args.start_date_str, args.end_date_str)
+    if funds is None:
+        return
+    print(f"读取本地数据并计算指标，耗时 {time.time() - start_time:.2f} 秒")
+
+    start_time = time.time()
+    result = sweep(funds, grids, stage2.EXCLUDED_STATUSES)
+    print(f"共 {len(result)} 个参数组合，筛选耗时 {time.time() - start_time:.3f} 秒\n")
+
+    print(result.to_string(index=False, max_colwidth=60))
+
+    if args.excel_path:
+        result.to_excel(args.excel_path, index=False)
+        print(f"扫描结果已导出到：{args.excel_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+全局令牌桶限速器
+
+功能概述：
+- 每个数据源主机一个令牌桶，所有步骤、所有请求方式（线程内同步调用、异步引擎）共用
+- 可分别设置每秒请求数（rate）和突发请求数（burst）
+- 取代各步骤中固定的休眠，请求速率保持在允许的上限附近
+
+使用方式：
+- 同步调用前：rate_limit.acquire_for_endpoint("fund_purchase_em") 或 limiter_for(host).acquire()
+- 异步请求前：await limiter_for(host).acquire_async()
+- 调整限速：rate_limit.configure("danjuanfunds.com", rate=5, burst=10)
+"""
+
+import asyncio
+import threading
+import time
+
+# 各主机默认限速：(每秒请求数, 突发请求数)
+HOST_RATE_LIMITS = {
+    "fund.eastmoney.com": (10, 20),
+    "api.fund.eastmoney.com": (10, 20),
+    "danjuanfunds.com": (5, 10),
+}
+DEFAULT_RATE_LIMIT = (5, 5)
+
+# akshare接口对应的数据源主机（用于同步调用akshare时限速）
+ENDPOINT_HOSTS = {
+    "fund_name_em": "fund.eastmoney.com",
+    "fund_purchase_em": "fund.eastmoney.com",
+    "fund_open_fund_info_em": "fund.eastmoney.com",
+    "fund_individual_basic_info_xq": "danjuanfunds.com",
+    "fund_individual_achievement_xq": "danjuanfunds.com",
+}
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶：令牌按 rate 个/秒补充，最多积累 burst 个；
+    令牌不足时预约下一个令牌并等待，调用方按预约顺序依次放行
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """取走一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """同步获取一个令牌（在线程中调用）"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """异步获取一个令牌（在事件循环中调用）"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_limiters = {}
+_registry_lock = threading.Lock()
+
+
+def limiter_for(host):
+    """返回主机对应的令牌桶（首次使用时按 HOST_RATE_LIMITS 创建）"""
+    with _registry_lock:
+        if host not in _limiters:
+            rate, burst = HOST_RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+            _limiters[host] = TokenBucket(rate, burst)
+        return _limiters[host]
+
+
+def configure(host, rate, burst):
+    """设置主机的限速（会替换已创建的令牌桶）"""
+    with _registry_lock:
+        HOST_RATE_LIMITS[host] = (rate, burst)
+        _limiters[host] = TokenBucket(rate, burst)
+
+
+def acquire_for_endpoint(endpoint):
+    """同步调用akshare接口前获取对应主机的令牌"""
+    limiter_for(ENDPOINT_HOSTS.get(endpoint, endpoint)).acquire()
+
+
+def parse_rate_spec(spec):
+    """
+    解析命令行限速设置
+    :param spec: 形如 "danjuanfunds.com=5:10" 的字符串（主机=每秒请求数:突发请求数）
+    :return: (主机, 每秒请求数, 突发请求数)
+    """
+    host, _, limits = spec.partition("=")
+    rate, _, burst = limits.partition(":")
+    rate = float(rate)
+    return host, rate, float(burst) if burst else max(1.0, rate)
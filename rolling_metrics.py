@@ -0,0 +1,174 @@
+"""
+滚动窗口Ulcer指数和Martin比率
+
+功能概述：
+- 对单只基金计算以每个交易日（或每个月末）为结束日期的滚动窗口（默认3年）指标序列
+- 输出每个窗口的年化收益率、Ulcer指数和Martin比率，用于观察Martin比率是否稳定
+- 整个序列的计算量与净值天数成线性关系，不再对每个窗口重复调用 calculate_ulcer_index
+
+算法说明：
+- 窗口内的回撤以窗口起点之后的累计峰值为基准
+- 对每个交易日预先求出之后第一个更高净值的位置（峰值链），并沿峰值链从后向前累加回撤平方和
+- 同一峰值下的一段回撤平方和由净值及其平方的前缀和直接求出
+- 窗口 [起点, 终点] 的回撤平方和 = 起点到窗口最高点之间沿峰值链的累加值 + 窗口最高点之后一段的值
+- 窗口最高点用单调队列随窗口滑动维护
+
+用法：
+python rolling_metrics.py 000001 [--years 3] [--freq M] [--risk-free-rate 1.5] [--export 滚动指标.xlsx]
+"""
+
+import argparse
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import nav_store
+
+
+def _next_higher(values):
+    """每个位置之后第一个净值严格更高的位置，不存在时为 len(values)"""
+    n = len(values)
+    next_higher = np.full(n, n, dtype=np.int64)
+    stack = []
+    for i in range(n):
+        while stack and values[stack[-1]] < values[i]:
+            next_higher[stack.pop()] = i
+        stack.append(i)
+    return next_higher
+
+
+def _window_maxima(values, starts, ends):
+    """
+    用单调队列求每个窗口内第一个最高点的位置
+    :param starts: 各窗口起点位置（非递减）
+    :param ends: 各窗口终点位置（非递减，包含终点）
+    """
+    argmax = np.empty(len(ends), dtype=np.int64)
+    window = deque()
+    pushed = 0
+    for k, (start, end) in enumerate(zip(starts, ends)):
+        while pushed <= end:
+            # 相同净值保留较早的位置，使队首为窗口内第一个最高点
+            while window and values[window[-1]] < values[pushed]:
+                window.pop()
+            window.append(pushed)
+            pushed += 1
+        while window[0] < start:
+            window.popleft()
+        argmax[k] = window[0]
+    return argmax
+
+
+def window_drawdown_sums(values, starts, ends):
+    """
+    计算多个窗口的回撤平方和，回撤以窗口内累计峰值为基准
+    :param values: 按日期升序的累计净值数组（不含缺失值）
+    :param starts: 各窗口起点位置（非递减）
+    :param ends: 各窗口终点位置（非递减，包含终点）
+    :return: 各窗口的回撤平方和数组
+    """
+    values = np.asarray(values, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n = len(values)
+
+    # 以首个净值为基准平移后做前缀和，减小大数相减带来的舍入误差
+    shifted = values - values[0]
+    prefix = np.concatenate([[0.0], np.cumsum(shifted)])
+    prefix_sq = np.concatenate([[0.0], np.cumsum(shifted ** 2)])
+
+    def segment(peak, last):
+        """同一峰值 values[peak] 下，peak ~ last 各日回撤平方和"""
+        count = last - peak + 1
+        total = prefix[last + 1] - prefix[peak]
+        total_sq = prefix_sq[last + 1] - prefix_sq[peak]
+        base = shifted[peak]
+        return (count * base ** 2 - 2 * base * total + total_sq) / values[peak] ** 2
+
+    # 沿峰值链从后向前累加：chain[i] 为以 i 为起点、直到序列末尾的回撤平方和
+    next_higher = _next_higher(values)
+    segments = segment(np.arange(n), next_higher - 1)
+    chain = np.zeros(n + 1)
+    for i in range(n - 1, -1, -1):
+        chain[i] = segments[i] + chain[next_higher[i]]
+
+    peaks = _window_maxima(values, starts, ends)
+    sums = chain[starts] - chain[peaks] + segment(peaks, ends)
+    # 舍入误差可能产生极小的负数
+    return np.maximum(sums, 0.0)
+
+
+def rolling_metrics(fund_data, years=3, freq="D", risk_free_rate=1.5):
+    """
+    计算单只基金的滚动窗口指标序列
+    :param fund_data: 含净值日期、累计净值两列的DataFrame
+    :param years: 窗口长度（年）
+    :param freq: "D" 每个交易日为一个窗口终点，"M" 每个月最后一个交易日为一个窗口终点
+    :param risk_free_rate: 无风险利率（%）
+    :return: DataFrame：窗口起始日期、窗口结束日期、年化收益率(%)、Ulcer指数(%)、Martin Ratio；
+             净值历史不足一个完整窗口的终点不输出
+    """
+    fund_data = fund_data.dropna(subset=['累计净值']).sort_values('净值日期')
+    dates = pd.DatetimeIndex(pd.to_datetime(fund_data['净值日期']))
+    values = fund_data['累计净值'].to_numpy(dtype=np.float64)
+
+    ends = np.arange(len(dates))
+    if freq == "M":
+        # 每个月最后一个交易日
+        periods = dates.to_period("M")
+        ends = ends[np.r_[periods[1:] != periods[:-1], True]]
+
+    # 窗口起点为终点往前推 years 年后的第一个交易日，历史不足的终点去掉
+    window_begins = dates[ends] - pd.DateOffset(years=years)
+    ends = ends[window_begins >= dates[0]]
+    window_begins = window_begins[window_begins >= dates[0]]
+    starts = dates.searchsorted(window_begins, side="left")
+
+    columns = ['窗口起始日期', '窗口结束日期', '年化收益率(%)', 'Ulcer指数(%)', 'Martin Ratio']
+    if len(ends) == 0:
+        return pd.DataFrame(columns=columns)
+
+    # 与逐只基金计算相同：年限按起止日期的自然日数/365计算
+    span_years = (dates[ends] - dates[starts]).days.to_numpy() / 365
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annualized_return = ((values[ends] / values[starts]) ** (1 / span_years) - 1) * 100
+        ulcer_index = np.sqrt(window_drawdown_sums(values, starts, ends) / (ends - starts + 1)) * 100
+        martin_ratio = (annualized_return - risk_free_rate) / ulcer_index
+
+    return pd.DataFrame({
+        '窗口起始日期': dates[starts],
+        '窗口结束日期': dates[ends],
+        '年化收益率(%)': annualized_return,
+        'Ulcer指数(%)': ulcer_index,
+        'Martin Ratio': martin_ratio,
+    }, columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="计算单只基金的滚动窗口Ulcer指数和Martin比率")
+    parser.add_argument("fund_code", help="6位基金代码")
+    parser.add_argument("--years", type=int, default=3, help="窗口长度（年），默认 3")
+    parser.add_argument("--freq", choices=["D", "M"], default="M", help="D 每个交易日，M 每个月末，默认 M")
+    parser.add_argument("--risk-free-rate", type=float, default=1.5, help="无风险利率（%%），默认 1.5")
+    parser.add_argument("--export", dest="excel_path", help="把滚动指标导出为Excel")
+    args = parser.parse_args()
+
+    fund_code = args.fund_code.zfill(6)
+    series = rolling_metrics(nav_store.update_nav(fund_code), args.years, args.freq, args.risk_free_rate)
+    if series.empty:
+        print(f"基金 {fund_code} 的净值历史不足 {args.years} 年")
+        return
+
+    print(series.to_string(index=False))
+    martin = series['Martin Ratio']
+    print(f"\n基金 {fund_code} 共 {len(series)} 个窗口，Martin Ratio 平均 {martin.mean():.4f}，"
+          f"标准差 {martin.std():.4f}，最低 {martin.min():.4f}，最高 {martin.max():.4f}")
+
+    if args.excel_path:
+        series.to_excel(args.excel_path, index=False)
+        print(f"滚动指标已导出到：{args.excel_path}")
+
+
+if __name__ == "__main__":
+    main()
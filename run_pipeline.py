@@ -0,0 +1,133 @@
+"""
+债券基金筛选流水线（单进程运行）
+
+功能概述：
+- 在一个进程内依次运行第1~4步筛选程序
+- 各步骤之间直接传递DataFrame，不再通过Excel文件中转
+- 基金代码在第1步统一为6位字符串，后续步骤不再重复格式化
+- 只在最后按需导出一次Excel，便于在定时任务中连续运行
+- 加上 --stream 时改为流式运行（stream_pipeline.py）：每只基金通过一步后立即进入下一步，步骤之间用有界队列连接
+
+处理流程：
+1. 筛选成立满3年的债券基金（1.1_get_all_3year_bond_funds.py）
+2. 筛选可申购且购买起点不超过1000元的基金（2_buyable_and_cheap.py）
+3. 计算Ulcer指数、Martin比率并筛选（3_Ulcer_and_Martin.py）
+4. 由本地净值计算近1年、近3月收益率（4_revenue.py）
+5. 按需导出最终结果到Excel
+
+用法：
+python run_pipeline.py --export 大于三年的债券基金代码.xlsx [--rate danjuanfunds.com=5:10] [--resume] [--share-classes representative]
+python run_pipeline.py --stream --export 大于三年的债券基金代码.xlsx
+"""
+
+import argparse
+import importlib.util
+import os
+import time
+
+import rate_limit
+import share_class
+
+# 各步骤脚本文件名（文件名以数字开头，不能直接import）
+STAGE_FILES = {
+    "stage1": "1.1_get_all_3year_bond_funds.py",
+    "stage2": "2_buyable_and_cheap.py",
+    "stage3": "3_Ulcer_and_Martin.py",
+    "stage4": "4_revenue.py",
+}
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_stage(name):
+    """按文件路径加载步骤脚本，返回模块对象（不会执行脚本的 __main__ 部分）"""
+    path = os.path.join(BASE_DIR, STAGE_FILES[name])
+    spec = importlib.util.spec_from_file_location(f"bond_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_pipeline(start_date_str=None, end_date_str=None, risk_free_rate=None, export_path=None,
+                 resume=False, workers=None, share_classes="all"):
+    """
+    依次运行第1~4步，步骤之间在内存中传递DataFrame
+    :param start_date_str: 第3步计算区间起始日期，默认使用第3步脚本中的设置
+    :param end_date_str: 第3步计算区间结束日期，默认使用第3步脚本中的设置
+    :param risk_free_rate: 无风险利率（%），默认使用第3步脚本中的设置
+    :param export_path: 最终结果的Excel导出路径，为 None 时不导出
+    :param resume: 第1、3步是否从上次中断的断点续跑
+    :param workers: 第3步计算进程数，默认为物理核心数，0 表示在当前进程内计算
+    :param share_classes: "all" 保留全部份额，"representative" 每只基金只保留一个代表份额（之后各步骤只处理代表份额）
+    :return: 最终结果DataFrame；第1步或第2步获取数据失败时返回 None
+    """
+    stage1 = load_stage("stage1")
+    stage2 = load_stage("stage2")
+    stage3 = load_stage("stage3")
+    stage4 = load_stage("stage4")
+
+    start_date_str = start_date_str or stage3.START_DATE_STR
+    end_date_str = end_date_str or stage3.END_DATE_STR
+    risk_free_rate = stage3.RISK_FREE_RATE if risk_free_rate is None else risk_free_rate
+
+    start_time = time.time()
+
+    selected = stage1.select_valid_bond_funds(resume=resume, share_classes=share_classes)
+    if selected is None:
+        return None
+    funds_df, error_records = selected
+    stage1.save_error_records(error_records)
+    print(f"\n第1步完成：{len(funds_df)} 只基金，累计耗时 {time.time() - start_time:.2f} 秒")
+
+    funds_df = stage2.filter_buyable_funds(funds_df)
+    if funds_df is None:
+        return None
+    print(f"\n第2步完成：{len(funds_df)} 只基金，累计耗时 {time.time() - start_time:.2f} 秒")
+
+    funds_df = stage3.screen_funds(funds_df, start_date_str, end_date_str, risk_free_rate, resume=resume,
+                                   workers=workers)
+    print(f"\n第3步完成：{len(funds_df)} 只基金，累计耗时 {time.time() - start_time:.2f} 秒")
+
+    funds_df = stage4.add_fund_returns(funds_df)
+    print(f"\n第4步完成：{len(funds_df)} 只基金，累计耗时 {time.time() - start_time:.2f} 秒")
+
+    if export_path:
+        funds_df.to_excel(export_path, index=False)
+        print(f"结果已导出到：{export_path}")
+    return funds_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在一个进程内运行债券基金筛选第1~4步")
+    parser.add_argument("--start", dest="start_date_str", help="第3步计算区间起始日期，如 2023-02-24")
+    parser.add_argument("--end", dest="end_date_str", help="第3步计算区间结束日期，如 2026-02-24")
+    parser.add_argument("--risk-free-rate", type=float, help="无风险利率（%%），默认 1.5")
+    parser.add_argument("--export", dest="export_path", help="最终结果导出的Excel路径，不指定时不导出")
+    parser.add_argument("--rate", action="append", default=[], metavar="HOST=RPS[:BURST]",
+                        help="设置主机限速，如 danjuanfunds.com=5:10，可重复指定")
+    parser.add_argument("--resume", action="store_true", help="第1、3步从上次中断的断点续跑")
+    parser.add_argument("--workers", type=int, help="第3步计算进程数，默认为物理核心数，0 表示在当前进程内计算")
+    parser.add_argument("--share-classes", choices=share_class.SHARE_CLASS_MODES, default="all",
+                        help="all 保留全部份额（默认），representative 每只基金只保留一个代表份额（优先A类）")
+    parser.add_argument("--stream", action="store_true",
+                        help="流式运行：每只基金通过一步后立即进入下一步（不支持 --resume、--workers）")
+    args = parser.parse_args()
+    if args.stream and (args.resume or args.workers is not None):
+        parser.error("--stream 不支持 --resume、--workers")
+
+    for spec in args.rate:
+        rate_limit.configure(*rate_limit.parse_rate_spec(spec))
+
+    if args.stream:
+        # 流式流水线模块依赖本模块的 load_stage，在这里导入
+        import stream_pipeline
+        stream_pipeline.run_stream(args.start_date_str, args.end_date_str, args.risk_free_rate, args.export_path,
+                                   share_classes=args.share_classes)
+        return
+
+    run_pipeline(args.start_date_str, args.end_date_str, args.risk_free_rate, args.export_path,
+                 resume=args.resume, workers=args.workers, share_classes=args.share_classes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+基金份额类别（A/C/E 等）归并
+
+功能概述：
+- 同一只基金的A、C、E等份额投资同一个组合，成立日期相同，净值走势几乎一致
+- 按基金简称去掉末尾的份额字母（如"易方达纯债债券A" -> "易方达纯债债券"）归并为同一家族
+- 每个家族选出一个代表份额：优先A类，其次没有份额字母的，再次代码最小的
+- 第1步只为代表份额请求成立日期，家族内其他份额沿用代表份额的成立日期
+- 可以只保留代表份额（representative），也可以保留全部份额（all）
+
+说明：
+- 简称末尾的大写字母只在前一个字符不是大写字母时视为份额字母，ETF、LOF、FOF等结尾不会被拆开
+- 份额字母可以带括号，如"某某纯债(A)"
+"""
+
+import re
+
+import pandas as pd
+
+# 份额类别模式：全部份额或每个家族只保留代表份额
+SHARE_CLASS_MODES = ["all", "representative"]
+
+_SHARE_PATTERN = re.compile(r"^(?P<family>.*[^A-Z(（])[(（]?(?P<share>[A-Z])[)）]?$")
+
+
+def split_share_class(names):
+    """
+    拆分基金简称中的家族名称和份额字母
+    :param names: 基金简称Series
+    :return: DataFrame：家族、份额（没有份额字母的为空字符串）
+    """
+    names = names.astype(str).str.strip()
+    parts = names.str.extract(_SHARE_PATTERN)
+    return pd.DataFrame({
+        "家族": parts["family"].fillna(names).str.strip(),
+        "份额": parts["share"].fillna(""),
+    }, index=names.index)
+
+
+def resolve_families(funds):
+    """
+    把基金归并为份额家族并选出代表份额
+    :param funds: 含基金代码、基金简称两列的DataFrame
+    :return: 与 funds 行对齐的DataFrame：基金代码、家族、份额、代表代码
+    """
+    families = split_share_class(funds["基金简称"])
+    families.insert(0, "基金代码", funds["基金代码"].astype(str).to_numpy())
+
+    # A类优先，其次没有份额字母的，再按基金代码
+    priority = families["份额"].map({"A": 0, "": 1}).fillna(2)
+    order = families.assign(_priority=priority).sort_values(["家族", "_priority", "基金代码"])
+    representatives = order.drop_duplicates(subset="家族").set_index("家族")["基金代码"]
+    families["代表代码"] = families["家族"].map(representatives)
+    return families
@@ -0,0 +1,132 @@
+"""
+相同请求的合并（single-flight）
+
+功能概述：
+- 同一接口、同一参数的请求正在进行时，后来的调用不再发出新请求，而是等待这次请求完成并共用结果
+- 多个步骤、参数扫描、后台任务在同一进程中运行，或缓存为空时同时查询同一只基金，都只访问一次上游接口
+- 请求出错时，所有等待的调用得到同一个异常
+- 结果为DataFrame时，后来的调用得到浅拷贝：数据共用（只读），增删列不影响其他调用
+- SingleFlight 用于线程（同步调用），AsyncSingleFlight 用于事件循环内的协程
+
+使用方式：
+flight = SingleFlight()
+data = flight.do(("fund_purchase_em", key), lambda: ak.fund_purchase_em())
+
+async_flight = AsyncSingleFlight()
+data = await async_flight.do(("fund_open_fund_info_em", "000001"), lambda: fetcher.fund_open_fund_info_em("000001"))
+"""
+
+import asyncio
+import threading
+
+import pandas as pd
+
+
+def _share(result):
+    """把同一结果交给后来的调用：DataFrame返回浅拷贝，其他对象原样返回"""
+    if isinstance(result, pd.DataFrame):
+        return result.copy(deep=False)
+    return result
+
+
+# 执行请求的协程被取消时交给等待者的信号：重新执行请求
+_RETRY = object()
+
+
+class _Call:
+    """一次正在进行的请求"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """线程版：相同键的调用同时进行时只执行一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # 被合并（没有实际执行）的调用次数
+        self.shared = 0
+
+    def do(self, key, func):
+        """
+        执行 func，或等待相同键正在进行的调用
+        :param key: 可哈希的请求键，如 (接口名称, 参数)
+        :param func: 无参数函数
+        :return: func 的返回值
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _share(call.result)
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """协程版：同一事件循环内相同键的请求同时进行时只执行一次"""
+
+    def __init__(self):
+        self._calls = {}
+        self.shared = 0
+
+    async def do(self, key, factory):
+        """
+        等待 factory() 返回的协程，或等待相同键正在进行的请求
+        执行请求的调用被取消时，等待者不会收到取消，而是由其中一个重新执行 factory()
+        :param key: 可哈希的请求键
+        :param factory: 返回协程的无参数函数（只在实际执行时调用）
+        :return: 协程的返回值
+        """
+        loop = asyncio.get_running_loop()
+        # 不同事件循环的请求不能互相等待，按事件循环区分
+        loop_key = (id(loop), key)
+        while True:
+            future = self._calls.get(loop_key)
+            if future is None:
+                break
+            self.shared += 1
+            # shield：某个等待者被取消时不影响正在进行的请求
+            result = await asyncio.shield(future)
+            if result is not _RETRY:
+                return _share(result)
+            # 执行请求的调用被取消，重新检查：第一个醒来的等待者重新执行，其余的等待它
+            self.shared -= 1
+
+        future = self._calls[loop_key] = loop.create_future()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            del self._calls[loop_key]
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            del self._calls[loop_key]
+            future.set_exception(e)
+            # 没有等待者时不提示"异常未被读取"
+            future.exception()
+            raise
+        del self._calls[loop_key]
+        future.set_result(result)
+        return result
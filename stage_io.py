@@ -0,0 +1,131 @@
+"""
+步骤间中间结果的列式存储
+
+功能概述：
+- 各步骤的输出保存为Arrow IPC文件（不压缩），读取时使用内存映射，数值列零拷贝
+- 使用显式的列类型：基金代码保存为定长整数，申购状态保存为字典编码（读取后为分类类型）
+- 下一步骤只读取自己需要的列
+- Excel只在单独的导出步骤中生成
+
+存储文件：
+- stage_data/<步骤名>.arrow：stage1 ~ stage4 各步骤的输出
+
+用法：
+python stage_io.py --export 大于三年的债券基金代码.xlsx [--stage stage4]
+"""
+
+import argparse
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+# 中间结果目录，放在脚本同级目录下
+STAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_data")
+
+STAGE_NAMES = ["stage1", "stage2", "stage3", "stage4"]
+
+# 已知列的显式类型；不在表中的列按pandas类型自动推断
+STAGE_SCHEMA = {
+    "基金代码": pa.int32(),
+    "基金简称": pa.string(),
+    "申购状态": pa.dictionary(pa.int8(), pa.string()),
+    "购买起点": pa.float64(),
+    "年化收益率(%)": pa.float64(),
+    "Ulcer指数(%)": pa.float64(),
+    "Martin Ratio": pa.float64(),
+    "最大回撤(%)": pa.float64(),
+    "近1年收益率(%)": pa.float64(),
+    "近3月收益率(%)": pa.float64(),
+}
+
+
+def stage_path(name):
+    return os.path.join(STAGE_DIR, f"{name}.arrow")
+
+
+def _to_table(df):
+    """按显式类型把DataFrame转换为Arrow表"""
+    arrays = []
+    fields = []
+    for column in df.columns:
+        values = df[column]
+        arrow_type = STAGE_SCHEMA.get(column)
+        if column == "基金代码":
+            values = pd.to_numeric(values, errors="raise")
+        elif arrow_type == pa.float64():
+            # 收益率等数值列中的"查询失败"等文字标记转为空值
+            values = pd.to_numeric(values, errors="coerce")
+        elif arrow_type is not None and pa.types.is_dictionary(arrow_type):
+            values = values.astype("string")
+        array = pa.array(values, type=arrow_type, from_pandas=True)
+        arrays.append(array)
+        fields.append(pa.field(str(column), array.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def write_stage(df, name):
+    """
+    保存步骤输出，先写临时文件再替换
+    :param df: 步骤输出的DataFrame
+    :param name: 步骤名，例如 stage1
+    """
+    os.makedirs(STAGE_DIR, exist_ok=True)
+    table = _to_table(df)
+    path = stage_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_stage(name, columns=None):
+    """
+    以内存映射方式读取步骤输出
+    :param name: 步骤名，例如 stage1
+    :param columns: 需要读取的列，为 None 时读取全部列
+    :return: DataFrame，基金代码还原为6位字符串，申购状态为分类类型
+    """
+    with pa.memory_map(stage_path(name), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+
+    df = table.to_pandas()
+    if "基金代码" in df.columns:
+        df["基金代码"] = df["基金代码"].map("{:06d}".format)
+    return df
+
+
+def latest_stage():
+    """返回已保存的最后一个步骤名；没有任何步骤输出时返回 None"""
+    for name in reversed(STAGE_NAMES):
+        if os.path.exists(stage_path(name)):
+            return name
+    return None
+
+
+def export_excel(name, excel_path):
+    """把步骤输出导出为Excel"""
+    df = read_stage(name)
+    df.to_excel(excel_path, index=False)
+    print(f"{name} 的结果（{len(df)} 只基金）已导出到：{excel_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把步骤中间结果导出为Excel")
+    parser.add_argument("--export", dest="excel_path", default="大于三年的债券基金代码.xlsx",
+                        help="导出的Excel路径")
+    parser.add_argument("--stage", choices=STAGE_NAMES, help="要导出的步骤，默认导出已保存的最后一个步骤")
+    args = parser.parse_args()
+
+    name = args.stage or latest_stage()
+    if name is None:
+        print(f"{STAGE_DIR} 中没有任何步骤的输出")
+        return
+    export_excel(name, args.excel_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+债券基金筛选流水线（流式运行）
+
+功能概述：
+- 第1~4步不再逐步等待：一只基金通过成立时间检查后立即进入申购状态筛选，随后立即更新净值、计算指标和收益率
+- 相邻步骤之间用有界队列（QUEUE_SIZE）连接，下游处理不过来时上游暂停取新的基金，内存占用不随基金池增长
+- 成立时间、申购状态、净值三类请求同时进行，各个主机的连接都保持忙碌
+- 成立日期已在本地索引中的基金最先进入下游，第一只合格基金在几秒内即可输出
+- 最终结果的筛选条件和列与 run_pipeline.py 逐步运行时相同，按基金列表的顺序排列
+
+处理流程：
+1. 获取基金列表、保存快照、分类并归并份额家族（与第1步相同，不请求单只基金的接口）
+2. 成立时间步骤：本地索引中已满3年的基金直接放入队列；缺少成立日期的代表份额通过异步引擎获取，
+   按完成顺序逐只判断，满3年时把整个家族放入队列；获取到的成立日期写回索引
+3. 申购状态步骤：后台线程获取申购状态表并对所有候选基金一次关联筛选，之后每只基金只查一次字典
+4. 净值步骤：NAV_WORKERS 个协程从队列取基金，增量更新本地净值（nav_store），计算Ulcer指数、Martin比率并按第3步的阈值筛选
+5. 收益率步骤：用同一份净值计算近1年、近3月收益率，得到一行最终结果
+6. 按需导出最终结果到Excel
+
+说明：
+- 不使用断点日志：成立日期索引、本地净值和接口缓存本身可以复用，中断后重新运行只请求还没有获取的数据
+- 指标在当前进程内逐只基金计算，不启动计算进程
+- 收益率截止到各基金自己最新的净值日期，与逐步运行时相同
+
+用法：
+python run_pipeline.py --stream [--export 大于三年的债券基金代码.xlsx] [--share-classes representative]
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import batch_metrics
+import compute_pool
+import concurrency
+import establish_index
+import nav_store
+from async_fetch import AsyncFetcher
+from run_pipeline import load_stage
+
+# 相邻步骤之间队列的容量
+QUEUE_SIZE = 256
+
+# 净值步骤的协程数（实际并发请求数仍由主机上限和AIMD控制器决定）
+NAV_WORKERS = 64
+
+# 队列结束标记
+_DONE = None
+
+
+def _fund_metrics(stage3, fund_code, fund_data, start_date_str, end_date_str, risk_free_rate):
+    """
+    计算一只基金的区间指标并按第3步的阈值筛选
+    :return: 指标字典（基金代码、年化收益率(%)、Ulcer指数(%)、Martin Ratio、最大回撤(%)）；无效或未通过筛选时返回 None
+    """
+    dates, codes, panel = batch_metrics.build_panel({fund_code: fund_data}, batch_metrics.window_begin(start_date_str),
+                                                    end_date_str)
+    metrics = batch_metrics.panel_metrics(dates, panel, start_date_str, end_date_str, risk_free_rate)
+    metrics_df = stage3.filter_metrics(batch_metrics.metrics_frame(codes, metrics))
+    if metrics_df.empty:
+        return None
+    return metrics_df.iloc[0].to_dict()
+
+
+async def _stream(stages, bond_funds, families, start_date_str, end_date_str, risk_free_rate, start_time):
+    """
+    在一个事件循环内运行四个步骤，步骤之间用有界队列连接
+    :return: (最终结果行的列表, 第1步错误记录列表, 是否获取申购状态数据失败)
+    """
+    stage1, stage2, stage3, stage4 = stages
+
+    three_years_ago = datetime.now() - timedelta(days=3 * 365)
+    fund_names = dict(zip(bond_funds['基金代码'], bond_funds['基金简称']))
+
+    # 成立日期已在索引中的家族直接判断，其余代表份额按完成顺序获取
+    index = establish_index.load_index()
+    members = families.groupby('代表代码', sort=False)['基金代码'].apply(list)
+    missing = establish_index.missing_codes(index, members.index.tolist())
+    known = families[~families['代表代码'].isin(missing)]
+    known_valid = known.loc[establish_index.established_before(index, known['代表代码'], three_years_ago), '基金代码']
+    print(f"\n成立时间阈值：{three_years_ago.strftime('%Y-%m-%d')}，本地索引中已满3年 {len(known_valid)} 只，"
+          f"需要获取成立日期 {len(missing)} 只")
+
+    established = asyncio.Queue(QUEUE_SIZE)
+    buyable = asyncio.Queue(QUEUE_SIZE)
+    screened = asyncio.Queue(QUEUE_SIZE)
+    rows = []
+    error_records = []
+    counts = {'established': 0, 'buyable': 0, 'screened': 0}
+    purchase_failed = False
+
+    def log_done(label, count):
+        print(f"\n{label}完成：{count} 只基金，累计耗时 {time.time() - start_time:.2f} 秒")
+
+    async def establish_stage(fetcher):
+        new_dates = {}
+        try:
+            for fund_code in known_valid:
+                counts['established'] += 1
+                await established.put(fund_code)
+            async for fund_code, fund_info in fetcher.iter_fetch("fund_individual_basic_info_xq", missing):
+                _, establish_date, error_record = stage1.check_fund_establishment(fund_code, fund_names[fund_code],
+                                                                                  fund_info)
+                if error_record:
+                    error_records.append(error_record)
+                    continue
+                new_dates[fund_code] = establish_date
+                if establish_date <= three_years_ago:
+                    for member in members[fund_code]:
+                        counts['established'] += 1
+                        await established.put(member)
+        finally:
+            # 中途中断时也保存已获取的成立日期
+            establish_index.save_index(establish_index.add_dates(index, new_dates))
+        await established.put(_DONE)
+        log_done("成立时间步骤", counts['established'])
+
+    async def purchase_stage(purchase_info):
+        nonlocal purchase_failed
+        buyable_df = await purchase_info
+        purchase_failed = buyable_df is None
+        buyable_rows = {} if purchase_failed else {row['基金代码']: row for row in buyable_df.to_dict('records')}
+        while True:
+            fund_code = await established.get()
+            if fund_code is _DONE:
+                break
+            # 申购状态数据获取失败时继续取出上游的基金，成立日期仍写入索引
+            row = buyable_rows.get(fund_code)
+            if row is not None:
+                counts['buyable'] += 1
+                await buyable.put(row)
+        await buyable.put(_DONE)
+        log_done("申购状态步骤", counts['buyable'])
+
+    async def nav_worker(fetcher):
+        while True:
+            row = await buyable.get()
+            if row is _DONE:
+                # 放回结束标记，让其他协程也能结束
+                await buyable.put(_DONE)
+                return
+            fund_code = row['基金代码']
+            fund_data, _ = await nav_store.refresh_async(fetcher, fund_code)
+            if fund_data is None or fund_data.empty:
+                print(f"未获取到基金 {fund_code} 有效的净值数据，请检查基金代码或网络连接。")
+                continue
+            metrics = _fund_metrics(stage3, fund_code, fund_data, start_date_str, end_date_str, risk_free_rate)
+            if metrics is not None:
+                counts['screened'] += 1
+                await screened.put((dict(row, **metrics), fund_data))
+
+    async def nav_stage(fetcher):
+        await asyncio.gather(*(nav_worker(fetcher) for _ in range(NAV_WORKERS)))
+        await screened.put(_DONE)
+        log_done("净值步骤", counts['screened'])
+
+    async def returns_stage():
+        while True:
+            item = await screened.get()
+            if item is _DONE:
+                break
+            row, fund_data = item
+            returns = batch_metrics.multi_horizon_metrics({row['基金代码']: fund_data}, stage4.RETURN_HORIZONS,
+                                                          stage4.RETURN_METRICS)
+            row.update(returns.iloc[0].drop('基金代码').to_dict())
+            rows.append(row)
+            if len(rows) == 1:
+                print(f"\n第1只合格基金 {row['基金代码']}，耗时 {time.time() - start_time:.2f} 秒")
+            print(f"✅ 合格基金 {row['基金代码']} {row['基金简称']}：年化收益率 {row['年化收益率(%)']:.4f}%，"
+                  f"Martin Ratio {row['Martin Ratio']:.4f}")
+        log_done("收益率步骤", len(rows))
+
+    # 申购状态表在后台线程中获取，并对所有候选基金一次关联筛选
+    loop = asyncio.get_running_loop()
+    purchase_info = loop.run_in_executor(None, stage2.filter_buyable_funds, families[['基金代码']])
+
+    async with AsyncFetcher() as fetcher:
+        await asyncio.gather(establish_stage(fetcher), purchase_stage(purchase_info), nav_stage(fetcher),
+                             returns_stage())
+    return rows, error_records, purchase_failed
+
+
+def run_stream(start_date_str=None, end_date_str=None, risk_free_rate=None, export_path=None, share_classes="all"):
+    """
+    流式运行第1~4步，每只基金通过一步后立即进入下一步
+    :param start_date_str: 第3步计算区间起始日期，默认使用第3步脚本中的设置
+    :param end_date_str: 第3步计算区间结束日期，默认使用第3步脚本中的设置
+    :param risk_free_rate: 无风险利率（%），默认使用第3步脚本中的设置
+    :param export_path: 最终结果的Excel导出路径，为 None 时不导出
+    :param share_classes: "all" 保留全部份额，"representative" 每只基金只保留一个代表份额
+    :return: 最终结果DataFrame；获取基金列表或申购状态数据失败时返回 None
+    """
+    stages = tuple(load_stage(name) for name in ["stage1", "stage2", "stage3", "stage4"])
+    stage1, stage2, stage3, stage4 = stages
+
+    start_date_str = start_date_str or stage3.START_DATE_STR
+    end_date_str = end_date_str or stage3.END_DATE_STR
+    risk_free_rate = stage3.RISK_FREE_RATE if risk_free_rate is None else risk_free_rate
+
+    start_time = time.time()
+
+    universe = stage1.load_bond_universe()
+    if universe is None:
+        return None
+    bond_funds, families, _ = universe
+    if share_classes == "representative":
+        families = families[families['基金代码'] == families['代表代码']]
+
+    rows, error_records, purchase_failed = asyncio.run(
+        _stream(stages, bond_funds, families, start_date_str, end_date_str, risk_free_rate, start_time))
+    concurrency.log_states()
+    stage1.save_error_records(error_records)
+    if purchase_failed:
+        return None
+
+    # 按基金列表的顺序排列，列与逐步运行时相同
+    return_columns = [f"{horizon}{batch_metrics.METRIC_COLUMNS[metric]}"
+                      for horizon in stage4.RETURN_HORIZONS for metric in stage4.RETURN_METRICS]
+    columns = ['基金代码'] + stage2.INFO_COLUMNS + compute_pool.RESULT_COLUMNS[1:] + return_columns
+    position = {fund_code: i for i, fund_code in enumerate(bond_funds['基金代码'])}
+    funds_df = pd.DataFrame(rows, columns=columns)
+    funds_df = (funds_df.assign(_order=funds_df['基金代码'].map(position)).sort_values('_order', kind='stable')
+                .drop(columns='_order').reset_index(drop=True))
+    print(f"\n流式运行完成：{len(funds_df)} 只基金，处理失败：{len(error_records)} 只，"
+          f"累计耗时 {time.time() - start_time:.2f} 秒")
+
+    if export_path:
+        funds_df.to_excel(export_path, index=False)
+        print(f"结果已导出到：{export_path}")
+    return funds_df
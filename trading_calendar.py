@@ -0,0 +1,71 @@
+"""
+交易日历与日期对齐
+
+功能概述：
+- 以所有基金净值日期的并集作为共用的交易日历（升序、不重复）
+- 用有序数组二分查找，把请求的日期一次性对齐到当天或之前最近的交易日
+- 基金在对齐后的交易日没有净值时（停牌、数据缺失等），沿用该基金之前最近的净值
+- 之前最近的净值距离对齐日期超过 MAX_GAP_DAYS 天时视为没有净值，避免使用已停止更新的旧数据
+
+计算区间的起止日期落在周末或节假日时，不再因为找不到当天的净值而丢弃基金。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 沿用之前净值的最大间隔（自然日）
+MAX_GAP_DAYS = 30
+
+
+def build_calendar(date_arrays):
+    """
+    合并多只基金的净值日期为共用的交易日历
+    :param date_arrays: 各基金净值日期数组的列表
+    :return: 升序、不重复的DatetimeIndex
+    """
+    date_arrays = [np.asarray(dates, dtype='datetime64[ns]') for dates in date_arrays]
+    if not date_arrays:
+        return pd.DatetimeIndex([])
+    return pd.DatetimeIndex(np.unique(np.concatenate(date_arrays)))
+
+
+def prior_positions(calendar, dates):
+    """
+    求各日期在交易日历中当天或之前最近的交易日位置
+    :param calendar: 升序的交易日历
+    :param dates: 需要对齐的日期列表
+    :return: 位置数组，早于交易日历第一天的日期为 -1
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return pd.DatetimeIndex(calendar).searchsorted(dates, side='right') - 1
+
+
+def align_dates(calendar, dates):
+    """
+    把日期对齐到当天或之前最近的交易日
+    :return: 对齐后的DatetimeIndex，早于交易日历第一天的日期为 NaT
+    """
+    calendar = pd.DatetimeIndex(calendar)
+    positions = prior_positions(calendar, dates)
+    aligned = calendar[np.maximum(positions, 0)] if len(calendar) else pd.DatetimeIndex([pd.NaT] * len(positions))
+    return aligned.where(positions >= 0, pd.NaT)
+
+
+def forward_fill(calendar, panel):
+    """
+    按列沿用之前最近的净值，间隔超过 MAX_GAP_DAYS 天的不沿用
+    :param calendar: 矩阵各行对应的交易日
+    :param panel: 形状为 [交易日数, 基金数] 的净值矩阵，缺失为 NaN
+    :return: 填充后的矩阵
+    """
+    if panel.size == 0:
+        return panel.copy()
+    rows = np.arange(panel.shape[0])[:, None]
+    # 每个位置之前（含当天）最近一个有净值的行号
+    source = np.maximum.accumulate(np.where(np.isnan(panel), -1, rows), axis=0)
+    filled = panel[np.maximum(source, 0), np.arange(panel.shape[1])]
+
+    calendar = np.asarray(calendar, dtype='datetime64[ns]')
+    gap = calendar[:, None] - calendar[np.maximum(source, 0)]
+    too_old = (source < 0) | (gap > np.timedelta64(MAX_GAP_DAYS, 'D'))
+    return np.where(too_old, np.nan, filled)
@@ -0,0 +1,170 @@
+"""
+全市场基金列表的每日快照与差异比较
+
+功能概述：
+- 每次获取 fund_name_em 基金列表后按日期保存一份快照（基金代码、基金简称、基金类型）
+- 与之前最近一天的快照比较，找出新增、删除（退市、合并等）和更名的基金
+- 第1步只对新增基金（以及成立日期索引中还没有的基金）请求成立时间
+- 只保留最近 KEEP_SNAPSHOTS 份快照
+
+存储文件：
+- universe_snapshots/<YYYY-MM-DD>.parquet：当天的基金列表快照
+
+用法：
+python universe_snapshot.py [--date 2026-02-24] [--against 2026-02-20] [--export 基金列表变化.xlsx]
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# 快照目录，放在脚本同级目录下
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "universe_snapshots")
+
+# 保存的快照份数
+KEEP_SNAPSHOTS = 30
+
+SNAPSHOT_COLUMNS = ["基金代码", "基金简称", "基金类型"]
+
+DIFF_COLUMNS = ["基金代码", "变化", "原基金简称", "基金简称", "基金类型"]
+
+
+def _snapshot_path(date_str):
+    return os.path.join(SNAPSHOT_DIR, f"{date_str}.parquet")
+
+
+def snapshot_dates():
+    """已保存快照的日期（升序的 YYYY-MM-DD 字符串列表）"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    return sorted(name[:-len(".parquet")] for name in os.listdir(SNAPSHOT_DIR) if name.endswith(".parquet"))
+
+
+def save_snapshot(all_funds, date_str=None):
+    """
+    保存基金列表快照，同一天重复运行时覆盖当天的快照，并删除超出保留份数的旧快照
+    :param all_funds: fund_name_em 返回的DataFrame（基金代码已为6位字符串）
+    :param date_str: 快照日期，默认今天
+    :return: 快照日期
+    """
+    date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+    columns = [column for column in SNAPSHOT_COLUMNS if column in all_funds.columns]
+    snapshot = all_funds[columns].drop_duplicates(subset="基金代码").reset_index(drop=True)
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _snapshot_path(date_str)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    snapshot.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+    for old_date in snapshot_dates()[:-KEEP_SNAPSHOTS]:
+        os.remove(_snapshot_path(old_date))
+    return date_str
+
+
+def load_snapshot(date_str):
+    """
+    读取指定日期的快照
+    :return: DataFrame；没有该日期的快照时返回 None
+    """
+    path = _snapshot_path(date_str)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def previous_date(date_str):
+    """早于 date_str 的最近一份快照的日期，没有时返回 None"""
+    earlier = [d for d in snapshot_dates() if d < date_str]
+    return earlier[-1] if earlier else None
+
+
+def diff_snapshots(old, new):
+    """
+    比较两份快照
+    :param old: 之前的快照，为 None 时视为全部新增
+    :param new: 当前的快照
+    :return: DataFrame，列见 DIFF_COLUMNS；变化为"新增"、"删除"或"更名"，没有变化的基金不输出
+    """
+    if old is None:
+        old = pd.DataFrame(columns=SNAPSHOT_COLUMNS)
+    merged = pd.merge(old[["基金代码", "基金简称"]].rename(columns={"基金简称": "原基金简称"}),
+                      new, on="基金代码", how="outer", indicator=True)
+    if "基金类型" not in merged.columns:
+        merged["基金类型"] = None
+
+    change = pd.Series(None, index=merged.index, dtype=object)
+    change[merged["_merge"] == "right_only"] = "新增"
+    change[merged["_merge"] == "left_only"] = "删除"
+    renamed = (merged["_merge"] == "both") & (merged["原基金简称"] != merged["基金简称"])
+    change[renamed] = "更名"
+    merged["变化"] = change
+
+    diff = merged[change.notna()][DIFF_COLUMNS]
+    return diff.sort_values(["变化", "基金代码"]).reset_index(drop=True)
+
+
+def record_universe(all_funds, date_str=None):
+    """
+    保存当天快照并与之前最近一天的快照比较
+    :param all_funds: fund_name_em 返回的DataFrame（基金代码已为6位字符串）
+    :param date_str: 快照日期，默认今天
+    :return: (之前快照的日期或 None, 差异DataFrame)
+    """
+    date_str = save_snapshot(all_funds, date_str)
+    old_date = previous_date(date_str)
+    old = load_snapshot(old_date) if old_date else None
+    diff = diff_snapshots(old, load_snapshot(date_str))
+    if old_date is None:
+        print(f"首次保存基金列表快照（{date_str}），共 {len(diff)} 只基金")
+    else:
+        counts = diff["变化"].value_counts()
+        print(f"基金列表较 {old_date}：新增 {counts.get('新增', 0)} 只，删除 {counts.get('删除', 0)} 只，"
+              f"更名 {counts.get('更名', 0)} 只")
+    return old_date, diff
+
+
+def codes_with_change(diff, *changes):
+    """差异中指定变化类型（"新增"、"删除"、"更名"）的基金代码列表"""
+    return diff.loc[diff["变化"].isin(changes), "基金代码"].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较两天的全市场基金列表快照")
+    parser.add_argument("--date", help="快照日期，默认为最近一份快照")
+    parser.add_argument("--against", help="与哪一天比较，默认为之前最近一份快照")
+    parser.add_argument("--export", dest="excel_path", help="把差异导出为Excel")
+    args = parser.parse_args()
+
+    dates = snapshot_dates()
+    if not dates:
+        print("还没有基金列表快照，请先运行第1步")
+        return
+    date_str = args.date or dates[-1]
+    old_date = args.against or previous_date(date_str)
+    new = load_snapshot(date_str)
+    if new is None:
+        print(f"没有 {date_str} 的快照")
+        return
+    if old_date is None:
+        print(f"{date_str} 之前没有快照")
+        return
+    old = load_snapshot(old_date)
+    if old is None:
+        print(f"没有 {old_date} 的快照")
+        return
+
+    diff = diff_snapshots(old, new)
+    print(f"{old_date} -> {date_str}：共 {len(diff)} 只基金有变化\n")
+    if not diff.empty:
+        print(diff.to_string(index=False))
+
+    if args.excel_path:
+        diff.to_excel(args.excel_path, index=False)
+        print(f"差异已导出到：{args.excel_path}")
+
+
+if __name__ == "__main__":
+    main()